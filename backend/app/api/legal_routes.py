@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from sqlalchemy.orm import Session
 import logging
+import asyncio
 
 from .. import crud, schemas, auth
 from ..database import get_db
@@ -22,8 +23,9 @@ async def extract_legal_clauses(
 ):
     """Extract and analyze legal clauses from document content"""
     try:
-        # Extract clauses using the service
-        result = clause_extractor.extract_clauses(
+        # Extract clauses using the service (blocking LLM call runs off the event loop)
+        result = await asyncio.to_thread(
+            clause_extractor.extract_clauses,
             document_content=request.document_content,
             document_id=str(request.document_id) if request.document_id else None
         )
@@ -65,8 +67,9 @@ async def check_compliance(
 ):
     """Check document compliance with relevant regulations"""
     try:
-        # Check compliance using the service
-        result = compliance_checker.check_compliance(
+        # Check compliance using the service (blocking LLM call runs off the event loop)
+        result = await asyncio.to_thread(
+            compliance_checker.check_compliance,
             document_content=request.document_content,
             jurisdiction=request.jurisdiction,
             document_id=str(request.document_id) if request.document_id else None
@@ -110,8 +113,9 @@ async def search_precedents(
 ):
     """Search for relevant legal precedents"""
     try:
-        # Search precedents using the service
-        result = precedent_engine.find_relevant_precedents(
+        # Search precedents using the service (blocking LLM call runs off the event loop)
+        result = await asyncio.to_thread(
+            precedent_engine.find_relevant_precedents,
             query=request.query,
             jurisdiction=request.jurisdiction,
             document_type=request.document_type
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, status
 from pydantic import BaseModel
 from typing import Optional, List
 from sqlalchemy.orm import Session
+import asyncio
 import os
 import uuid
 import hashlib
@@ -9,7 +10,7 @@ import logging
 import gc
 
 from app.core.vector_store import get_retriever, add_documents_to_vector_store
-from llm.client import query
+from llm.client import aquery
 from .. import crud, schemas, auth
 from ..database import get_db
 
@@ -100,8 +101,9 @@ class Query(BaseModel):
 @router.post("/ask")
 async def ask_question(query_data: Query):
     try:
-        # Get retriever only when needed
-        retriever = get_lazy_retriever()
+        # Get retriever only when needed; the first call loads (and may rebuild)
+        # the index, so it runs off the event loop
+        retriever = await asyncio.to_thread(get_lazy_retriever)
         docs = retriever.invoke(query_data.question)
         
         # Debug: Log what we retrieved with enhanced debugging
@@ -157,7 +159,7 @@ async def ask_question(query_data: Query):
             file_content = query_data.file_content[:1500]  # Increased from 1000
             context = f"{file_content}\n\n{context}"
         
-        answer = query(context, query_data.question)
+        answer = await aquery(context, query_data.question)
         if not answer or not str(answer).strip():
             answer = "Sorry, the language model did not return a valid response. Please try again later."
         
@@ -0,0 +1,110 @@
+"""PDF page text extraction for LegalDoc application."""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import List, Optional, Tuple
+
+try:
+    from pdf_config import get_config
+    _config = get_config(os.getenv("PDF_CONFIG_TIER", "free"))
+except ImportError:
+    _config = {}
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for large PDFs, opt-in per tier (0 on the free tier). Each
+# one imports pymupdf and holds an open document, so the pool is kept small
+# regardless of how many CPUs the host reports.
+MAX_EXTRACT_WORKERS = 2
+EXTRACT_WORKERS = min(_config.get('PDF_EXTRACT_WORKERS', 0), MAX_EXTRACT_WORKERS)
+
+# Below this many pages, process start-up costs more than extracting serially.
+PARALLEL_MIN_PAGES = 32
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Create the shared extraction pool on first use."""
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the server process already runs threads
+        _executor = ProcessPoolExecutor(
+            max_workers=EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_pdf_executor() -> None:
+    """Stop the extraction worker processes, if any were started."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract text for pages [start, stop) of a stored PDF with MuPDF (runs in worker processes)."""
+    import pymupdf
+
+    with pymupdf.open(file_path) as doc:
+        return [doc[page_num].get_text("text") for page_num in range(start, stop)]
+
+
+def _extract_all_pages(file_content: bytes) -> List[str]:
+    import pymupdf
+
+    with pymupdf.open(stream=file_content, filetype="pdf") as doc:
+        return [page.get_text("text") for page in doc]
+
+
+def _extract_with_pypdf(file_content: bytes) -> List[str]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(file_content))
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+async def extract_pdf_pages(
+    file_content: bytes,
+    file_path: Optional[str] = None
+) -> Tuple[List[str], str]:
+    """
+    Extract per-page text, returning (page_texts, extraction_method).
+
+    Uses MuPDF when available, falling back to pypdf; both run in a worker
+    thread. When extraction workers are enabled and the upload is stored at
+    ``file_path``, large documents are split across them in contiguous page
+    ranges, each worker reopening the file from disk rather than receiving a
+    copy of its bytes.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        logger.warning("pymupdf not installed, falling back to pypdf")
+        return await asyncio.to_thread(_extract_with_pypdf, file_content), "pypdf"
+
+    page_count = 0
+    if EXTRACT_WORKERS > 1 and file_path:
+        with pymupdf.open(stream=file_content, filetype="pdf") as doc:
+            page_count = doc.page_count
+
+    if page_count < PARALLEL_MIN_PAGES:
+        return await asyncio.to_thread(_extract_all_pages, file_content), "pymupdf"
+
+    step = -(-page_count // EXTRACT_WORKERS)  # Ceiling division
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(
+            executor, extract_page_range, file_path, start, min(start + step, page_count)
+        )
+        for start in range(0, page_count, step)
+    ))
+    return list(chain.from_iterable(results)), "pymupdf"
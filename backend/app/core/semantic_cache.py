@@ -0,0 +1,111 @@
+"""Semantic response cache for LegalDoc application."""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .vector_store import get_embedding_model
+
+logger = logging.getLogger(__name__)
+
+
+# Set once the embedding model fails to load, so callers stop retrying the load
+_model_unavailable = False
+
+
+def embed_text(text: str) -> Optional[np.ndarray]:
+    """Embed text as a float32 unit vector, or return None if embedding is unavailable."""
+    global _model_unavailable
+    if _model_unavailable:
+        return None
+    try:
+        model = get_embedding_model()
+    except Exception as e:
+        _model_unavailable = True
+        logger.warning(f"Embedding model unavailable, semantic caching disabled: {e}")
+        return None
+    try:
+        vector = np.asarray(model.embed_query(text), dtype=np.float32)
+    except Exception as e:
+        logger.warning(f"Embedding failed: {e}")
+        return None
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization, returning (codes, scales)."""
+    vectors = np.atleast_2d(vectors)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Approximate dot products between quantized rows and float query vectors."""
+    return (np.atleast_2d(queries) @ codes.T) * scales
+
+
+class SemanticCache:
+    """
+    In-memory cache that returns a stored value for semantically similar queries.
+    
+    Entries are grouped by scope (e.g. user and document context) and matched by
+    cosine similarity of normalized query embeddings against a threshold. Stored
+    embeddings are int8-quantized with a per-entry scale to cut memory 4x.
+    """
+    
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries_per_scope: int = 256,
+        max_scopes: int = 1024
+    ):
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_scopes = max_scopes
+        self._embeddings: "OrderedDict[Hashable, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._values: Dict[Hashable, List[Any]] = {}
+        self._lock = threading.Lock()
+    
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text as a unit vector, or return None if embedding is unavailable."""
+        return embed_text(text)
+    
+    def lookup(self, scope: Hashable, embedding: np.ndarray) -> Optional[Any]:
+        """Return the cached value most similar to the embedding if above threshold."""
+        with self._lock:
+            entry = self._embeddings.get(scope)
+            if entry is None:
+                return None
+            scores = int8_scores(*entry, embedding)[0]
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._embeddings.move_to_end(scope)
+            return self._values[scope][best]
+    
+    def store(self, scope: Hashable, embedding: np.ndarray, value: Any) -> None:
+        """Add an entry, evicting the oldest entries of the scope and least recent scopes."""
+        code, scale = quantize_int8(embedding)
+        with self._lock:
+            entry = self._embeddings.get(scope)
+            if entry is None:
+                codes, scales = code, scale
+                values = [value]
+            else:
+                codes = np.vstack([entry[0], code])[-self.max_entries_per_scope:]
+                scales = np.concatenate([entry[1], scale])[-self.max_entries_per_scope:]
+                values = (self._values[scope] + [value])[-self.max_entries_per_scope:]
+            
+            self._embeddings[scope] = (codes, scales)
+            self._embeddings.move_to_end(scope)
+            self._values[scope] = values
+            
+            while len(self._embeddings) > self.max_scopes:
+                evicted, _ = self._embeddings.popitem(last=False)
+                del self._values[evicted]
@@ -1,6 +1,7 @@
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.schema import Document
+import asyncio
 import os
 import pickle
 import logging
@@ -10,23 +11,36 @@ logger = logging.getLogger(__name__)
 # Lazy loading for embedding model to reduce initial memory usage
 _embedding_model = None
 
+# Chunks per forward pass when embedding many texts at once
+EMBEDDING_BATCH_SIZE = 64
+
+def _embedding_device():
+    """Use the GPU for embeddings when one is available."""
+    try:
+        import torch
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    except ImportError:
+        return 'cpu'
+
 def get_embedding_model():
     global _embedding_model
     if _embedding_model is None:
+        device = _embedding_device()
+        encode_kwargs = {'normalize_embeddings': True, 'batch_size': EMBEDDING_BATCH_SIZE}
         try:
             _embedding_model = HuggingFaceEmbeddings(
                 model_name="sentence-transformers/paraphrase-MiniLM-L3-v2",
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
+                model_kwargs={'device': device},
+                encode_kwargs=encode_kwargs
             )
-            logger.info("Loaded embedding model: paraphrase-MiniLM-L3-v2")
+            logger.info(f"Loaded embedding model: paraphrase-MiniLM-L3-v2 on {device}")
         except Exception as e:
             logger.warning(f"Failed to load paraphrase-MiniLM-L3-v2: {e}")
             try:
                 _embedding_model = HuggingFaceEmbeddings(
                     model_name="sentence-transformers/all-MiniLM-L6-v2",
-                    model_kwargs={'device': 'cpu'},
-                    encode_kwargs={'normalize_embeddings': True}
+                    model_kwargs={'device': device},
+                    encode_kwargs=encode_kwargs
                 )
                 logger.info("Loaded fallback embedding model: all-MiniLM-L6-v2")
             except Exception as e2:
@@ -39,6 +53,32 @@ index_path = "index"
 # Global variable to store the FAISS database
 _global_db = None
 
+# Past this many vectors exact search is swapped for an HNSW graph (approximate,
+# sublinear per query); smaller corpora stay on the exact flat index
+HNSW_MIN_VECTORS = 10_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+def _maybe_use_hnsw(db) -> None:
+    """
+    Rebuild a large flat FAISS index as HNSW over the same vectors and metric.
+    
+    CPU-bound for seconds on a large corpus; async callers run it in a worker
+    thread. Searches keep using the flat index until the swap at the end.
+    """
+    import faiss
+    
+    index = db.index
+    if not isinstance(index, faiss.IndexFlat) or index.ntotal < HNSW_MIN_VECTORS:
+        return
+    hnsw = faiss.IndexHNSWFlat(index.d, HNSW_M, index.metric_type)
+    hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+    hnsw.add(index.reconstruct_n(0, index.ntotal))
+    db.index = hnsw
+    logger.info(f"Rebuilt FAISS index as HNSW over {hnsw.ntotal} vectors")
+
 def get_retriever(k=5):
     global _global_db
     try:
@@ -50,6 +90,7 @@ def get_retriever(k=5):
                 try:
                     logger.info("Loading existing FAISS index")
                     _global_db = FAISS.load_local(index_path, embedding_model, allow_dangerous_deserialization=True)
+                    _maybe_use_hnsw(_global_db)
                     logger.info("Successfully loaded existing FAISS index")
                 except Exception as e:
                     logger.warning(f"Failed to load existing index: {e}")
@@ -96,8 +137,8 @@ async def add_documents_to_vector_store(text: str, file_path: str):
             separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""]
         )
         
-        # Split text into chunks
-        chunks = text_splitter.split_text(text)
+        # Split text into chunks, dropping exact repeats before they are embedded
+        chunks = list(dict.fromkeys(text_splitter.split_text(text)))
         logger.info(f"Split text into {len(chunks)} chunks")
         
         # Create Document objects
@@ -122,9 +163,10 @@ async def add_documents_to_vector_store(text: str, file_path: str):
             logger.info("Creating new vector database from documents")
             _global_db = FAISS.from_documents(docs, embedding_model)
         else:
+            # Added in place: HNSW indexes cannot merge_from another index
             logger.info("Adding documents to existing vector database")
-            new_db = FAISS.from_documents(docs, embedding_model)
-            _global_db.merge_from(new_db)
+            _global_db.add_documents(docs)
+        await asyncio.to_thread(_maybe_use_hnsw, _global_db)
         
         # Save the updated index
         if not os.path.exists(index_path):
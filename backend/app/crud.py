@@ -306,16 +306,14 @@ def get_user_stats(db: Session) -> dict:
 
 def get_document_stats(db: Session) -> dict:
     """Get document statistics for admin dashboard"""
-    total_documents = db.query(models.Document).count()
-    
-    # Documents uploaded in the last 30 days
+    # Total count, last-30-days count and storage (simplified - sum of file sizes) in one aggregate
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    documents_this_month = db.query(models.Document).filter(
-        models.Document.created_at >= thirty_days_ago
-    ).count()
-    
-    # Calculate total storage (simplified - sum of file sizes)
-    total_size = db.query(func.sum(func.cast(models.Document.file_size, Integer))).scalar() or 0
+    total_documents, documents_this_month, total_size = db.query(
+        func.count(models.Document.id),
+        func.count(models.Document.id).filter(models.Document.created_at >= thirty_days_ago),
+        func.sum(func.cast(models.Document.file_size, Integer))
+    ).one()
+    total_size = total_size or 0
     total_storage_mb = total_size / (1024 * 1024)
     total_storage_used = f"{total_storage_mb:.2f} MB"
     
@@ -3,6 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import time
 import logging
 from .api import routes
@@ -11,8 +13,10 @@ from .api.admin_routes import router as admin_router
 from .api.legal_routes import router as legal_router
 from .api.chat_routes import router as chat_router
 from .database import engine
+from llm.client import get_http_client, close_http_client
 from . import models
 from .core.logging_config import setup_logging
+from .core.pdf_extraction import shutdown_pdf_executor
 from .exceptions import AppException
 
 # Setup logging
@@ -24,11 +28,17 @@ async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Startup
     logger.info("Starting up LegalDoc API v2.0")
+    # Bounded pool for blocking work (sync LLM calls, embeddings) run via asyncio.to_thread
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
     # Create database tables
     models.Base.metadata.create_all(bind=engine)
+    # Open the pooled LLM HTTP client up front; callers fetch it with get_http_client()
+    get_http_client()
     yield
     # Shutdown
     logger.info("Shutting down LegalDoc API")
+    await close_http_client()
+    shutdown_pdf_executor()
 
 app = FastAPI(
     title="LegalDoc API",
@@ -55,12 +65,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include routers
-app.include_router(auth_router, prefix="/api")
-app.include_router(routes.router, prefix="/api")
-app.include_router(admin_router, prefix="/api")
-app.include_router(legal_router, prefix="/api")
-app.include_router(chat_router, prefix="/api")
+# Trusted host filter - registered after CORS so it runs outermost and rejects
+# requests with unknown Host headers before CORS and routing
+app.add_middleware(
+    TrustedHostMiddleware,
+    allowed_hosts=[
+        "legaldoc-six.vercel.app",
+        "legal-document-parser.vercel.app",
+        "*.onrender.com",
+        "localhost",
+        "127.0.0.1",
+        "backend"
+    ],
+)
+
+# Include routers - ordered by expected traffic since Starlette matches routes linearly
+API_PREFIX = "/api"
+for router in (chat_router, legal_router, routes.router, auth_router, admin_router):
+    app.include_router(router, prefix=API_PREFIX)
 
 @app.get("/")
 def read_root():
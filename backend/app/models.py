@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Boolean, ForeignKey, Text, Float, Integer, Enum
+from sqlalchemy import Column, String, DateTime, Boolean, ForeignKey, Text, Float, Integer, Enum, Index, DDL, event
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -37,7 +37,7 @@ class Document(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     filename = Column(String, nullable=False)
     original_filename = Column(String, nullable=False)
-    file_hash = Column(String, unique=True, index=True, nullable=False)
+    file_hash = Column(String, nullable=False)
     file_size = Column(String, nullable=False)
     file_type = Column(String, nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
@@ -46,6 +46,27 @@ class Document(Base):
     
     user = relationship("User", back_populates="documents")
     analyses = relationship("DocumentAnalysis", back_populates="document")
+    
+    __table_args__ = (
+        # Duplicate detection is per user: (user_id, file_hash)
+        Index("ix_documents_user_hash", user_id, file_hash, unique=True),
+        # Per-user listings, newest first
+        Index("ix_documents_user_created", user_id, created_at),
+        # Trigram index so filename ILIKE '%term%' search avoids a sequential scan
+        Index(
+            "ix_documents_filename_trgm",
+            original_filename,
+            postgresql_using="gin",
+            postgresql_ops={"original_filename": "gin_trgm_ops"}
+        ),
+    )
+
+# gin_trgm_ops comes from the pg_trgm extension
+event.listen(
+    Document.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
@@ -57,13 +78,13 @@ class ChatSession(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     user = relationship("User", back_populates="chat_sessions")
-    messages = relationship("ChatMessage", back_populates="session")
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan", passive_deletes=True)
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey("chat_sessions.id"), nullable=False)
+    session_id = Column(UUID(as_uuid=True), ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False)
     message_type = Column(Enum(MessageType), nullable=False)
     content = Column(Text, nullable=False)
     sources = Column(JSONB, nullable=True)
@@ -71,6 +92,15 @@ class ChatMessage(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     
     session = relationship("ChatSession", back_populates="messages")
+    
+    __table_args__ = (
+        # Serves the per-session history queries (filter by session, order by timestamp)
+        Index(
+            "ix_chat_messages_session_timestamp",
+            session_id,
+            timestamp.desc(),
+        ),
+    )
 
 class DocumentAnalysis(Base):
     __tablename__ = "document_analyses"
@@ -2,19 +2,166 @@
 
 import logging
 import asyncio
-from typing import List, Dict, Any, Optional, AsyncGenerator
+import itertools
+import time
+from typing import List, Dict, Any, Optional, AsyncGenerator, Sequence, Tuple
 from datetime import datetime
 import uuid
 
+from llm import client as llm_client
+
+from ..core.semantic_cache import SemanticCache
 from ..exceptions import AIServiceError
 from ..schemas import MessageType
 
 logger = logging.getLogger(__name__)
 
+_SYSTEM_PROMPT = (
+    "You are a legal AI assistant specialized in Indian law. "
+    "Provide accurate, helpful responses based on the context provided. "
+    "Always cite sources when available and indicate confidence levels."
+)
+
+
+# Placeholder precedent results with fixed, illustrative relevance values
+_PRECEDENT_CORPUS: Tuple[Dict[str, Any], ...] = (
+    {
+        "title": "Relevant Case Law Example 1",
+        "court": "Supreme Court of India",
+        "date": "2023-01-15",
+        "citation": "2023 SCC 1",
+        "summary": "Case summary related to the query",
+        "relevance": 0.92,
+        "url": "https://example.com/case1"
+    },
+    {
+        "title": "Relevant Case Law Example 2",
+        "court": "Delhi High Court",
+        "date": "2022-11-20",
+        "citation": "2022 DHC 2",
+        "summary": "Another relevant case summary",
+        "relevance": 0.85,
+        "url": "https://example.com/case2"
+    }
+)
+
+_SUGGESTIONS: Tuple[str, ...] = (
+    "Can you explain this in simpler terms?",
+    "What are the potential risks here?",
+    "Are there any recent legal updates on this topic?",
+    "How does this compare to standard practices?"
+)
+_TOP_SUGGESTIONS: Tuple[str, ...] = _SUGGESTIONS[:3]  # Top 3 suggestions
+
+# Streaming frames are flushed at this size, after this many seconds, or at a sentence end
+_STREAM_FLUSH_SIZE = 512
+_STREAM_FLUSH_INTERVAL = 0.03
+_SENTENCE_ENDINGS = (".", "!", "?", "\n")
+
+# Record ids: a random 64-bit prefix drawn once per process, then a counter in
+# the low 64 bits - unique across workers without a CSPRNG read per id
+_ID_COUNTER = itertools.count(uuid.uuid4().int >> 64 << 64)
+
+
+def _fast_id() -> str:
+    """Return a unique in-process id formatted as a UUID string."""
+    return str(uuid.UUID(int=next(_ID_COUNTER)))
+
+
+def _render_history(messages: Sequence[Dict[str, Any]]) -> str:
+    """Render history turns as "Role: content" prompt lines."""
+    return "\n".join(
+        f"{msg.get('role', 'user').title()}: {msg.get('content', '')}"
+        for msg in messages
+    )
+
+
+class DocumentContext:
+    """Document context with prompt and source excerpts precomputed once."""
+    
+    def __init__(self, text: str):
+        self.text = text
+        self.length = len(text)
+        self.prompt_excerpt = text[:2000]
+        self.source_excerpt = text[:200] + "..." if self.length > 200 else text
+        self.cache_key = hash(text)
+
+
+class ClauseTable:
+    """Column-oriented clause records, materialized to dicts only at the API boundary."""
+    
+    __slots__ = (
+        "clause_type", "content", "page", "section", "importance",
+        "risk_level", "confidence", "suggestions"
+    )
+    
+    def __init__(
+        self,
+        clause_type: Sequence[str],
+        content: Sequence[str],
+        page: Sequence[int],
+        section: Sequence[str],
+        importance: Sequence[str],
+        risk_level: Sequence[str],
+        confidence: Sequence[float],
+        suggestions: Sequence[Sequence[str]]
+    ):
+        self.clause_type = tuple(clause_type)
+        self.content = tuple(content)
+        self.page = tuple(page)
+        self.section = tuple(section)
+        self.importance = tuple(importance)
+        self.risk_level = tuple(risk_level)
+        self.confidence = tuple(confidence)
+        self.suggestions = tuple(tuple(s) for s in suggestions)
+    
+    def confidence_scores(self) -> Dict[str, float]:
+        """Map clause type to confidence score."""
+        return dict(zip(self.clause_type, self.confidence))
+    
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Convert columns to the API's list-of-dicts clause format."""
+        return [
+            {
+                "id": _fast_id(),
+                "type": clause_type,
+                "content": content,
+                "location": {"page": page, "section": section},
+                "importance": importance,
+                "risk_level": risk_level,
+                "suggestions": list(suggestions)
+            }
+            for clause_type, content, page, section, importance, risk_level, suggestions in zip(
+                self.clause_type, self.content, self.page, self.section,
+                self.importance, self.risk_level, self.suggestions
+            )
+        ]
+
+
+# Placeholder clause extraction results
+_MOCK_CLAUSES = ClauseTable(
+    clause_type=["payment", "termination"],
+    content=[
+        "Payment terms clause extracted from document",
+        "Termination clause extracted from document"
+    ],
+    page=[1, 2],
+    section=["Payment Terms", "Termination"],
+    importance=["high", "critical"],
+    risk_level=["medium", "high"],
+    confidence=[0.92, 0.88],
+    suggestions=[
+        ["Consider adding penalty clauses for late payments"],
+        ["Clarify notice period requirements"]
+    ]
+)
+
 
 class AIResponse:
     """AI response wrapper."""
     
+    __slots__ = ("text", "sources", "confidence", "suggested_questions")
+    
     def __init__(
         self,
         text: str,
@@ -36,11 +183,12 @@ class AIService:
         self.embeddings_model = "text-embedding-3-large"
         self.max_tokens = 4000
         self.temperature = 0.1
+        self.semantic_cache = SemanticCache(threshold=0.92)
         
     async def generate_response(
         self,
         query: str,
-        context: Optional[str] = None,
+        context: Optional[DocumentContext] = None,
         conversation_history: Optional[List[Dict[str, Any]]] = None,
         user_id: Optional[str] = None
     ) -> AIResponse:
@@ -54,36 +202,62 @@ class AIService:
         - Confidence scoring
         """
         try:
-            logger.info(f"Generating AI response for user {user_id}")
+            logger.info("Generating AI response for user %s", user_id)
+            
+            # Serve near-duplicate queries against the same context and recent
+            # turns from the semantic cache; follow-ups like "explain that" depend
+            # on the history, so it is part of the scope
+            recent = conversation_history[-5:] if conversation_history else ()
+            cache_scope = (
+                user_id,
+                context.cache_key if context else None,
+                hash(tuple((msg.get('role'), msg.get('content')) for msg in recent))
+            )
+            query_embedding = await asyncio.to_thread(self.semantic_cache.embed, query)
+            if query_embedding is not None:
+                cached = self.semantic_cache.lookup(cache_scope, query_embedding)
+                if cached is not None:
+                    logger.info("Semantic cache hit for user %s", user_id)
+                    # Fresh source ids: each reply's sources are persisted with it
+                    return AIResponse(
+                        text=cached.text,
+                        sources=[{**source, "id": _fast_id()} for source in cached.sources],
+                        confidence=cached.confidence,
+                        suggested_questions=cached.suggested_questions
+                    )
             
             # Build prompt with context and history
             prompt = self._build_prompt(query, context, conversation_history)
             
-            # Simulate AI response (replace with actual Gemini API call)
             response_text = await self._call_ai_model(prompt)
             
-            # Extract sources and calculate confidence
+            # Both are cheap in-memory work; a thread hop would cost more
             sources = self._extract_sources(context) if context else []
-            confidence = self._calculate_confidence(response_text, context)
+            suggested_questions = self._generate_suggested_questions(query)
             
-            # Generate suggested questions
-            suggested_questions = self._generate_suggested_questions(query, response_text)
+            # Confidence depends on the generated text
+            confidence = self._calculate_confidence(response_text, context)
             
-            return AIResponse(
+            response = AIResponse(
                 text=response_text,
                 sources=sources,
                 confidence=confidence,
                 suggested_questions=suggested_questions
             )
             
+            if query_embedding is not None:
+                self.semantic_cache.store(cache_scope, query_embedding, response)
+            
+            return response
+            
         except Exception as e:
-            logger.error(f"Error generating AI response: {str(e)}")
+            logger.error("Error generating AI response: %s", e)
             raise AIServiceError(f"Failed to generate response: {str(e)}")
     
     async def stream_response(
         self,
         message: str,
-        context: Optional[str] = None,
+        context: Optional[DocumentContext] = None,
         chat_history: Optional[List[Dict[str, Any]]] = None,
         user_id: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
@@ -99,20 +273,29 @@ class AIService:
         try:
             prompt = self._build_prompt(message, context, chat_history)
             
-            # Simulate streaming response (replace with actual streaming API)
-            response_text = await self._call_ai_model(prompt)
+            # Coalesce model chunks into larger frames to amortize per-frame overhead
+            buffer: List[str] = []
+            buffered = 0
+            last_flush = time.monotonic()
+            async for chunk in self._stream_ai_model(prompt):
+                buffer.append(chunk)
+                buffered += len(chunk)
+                now = time.monotonic()
+                if (
+                    buffered >= _STREAM_FLUSH_SIZE
+                    or now - last_flush >= _STREAM_FLUSH_INTERVAL
+                    or chunk.endswith(_SENTENCE_ENDINGS)
+                ):
+                    yield "".join(buffer)
+                    buffer.clear()
+                    buffered = 0
+                    last_flush = now
             
-            # Stream the response word by word
-            words = response_text.split()
-            for i, word in enumerate(words):
-                if i == 0:
-                    yield word
-                else:
-                    yield f" {word}"
-                await asyncio.sleep(0.05)  # Simulate streaming delay
+            if buffer:
+                yield "".join(buffer)
                 
         except Exception as e:
-            logger.error(f"Error streaming response: {str(e)}")
+            logger.error("Error streaming response: %s", e)
             yield f"Error: {str(e)}"
     
     async def extract_clauses(
@@ -132,31 +315,9 @@ class AIService:
             logger.info("Extracting legal clauses from document")
             
             # Simulate clause extraction (replace with actual AI analysis)
-            clauses = [
-                {
-                    "id": str(uuid.uuid4()),
-                    "type": "payment",
-                    "content": "Payment terms clause extracted from document",
-                    "location": {"page": 1, "section": "Payment Terms"},
-                    "importance": "high",
-                    "risk_level": "medium",
-                    "suggestions": ["Consider adding penalty clauses for late payments"]
-                },
-                {
-                    "id": str(uuid.uuid4()),
-                    "type": "termination",
-                    "content": "Termination clause extracted from document",
-                    "location": {"page": 2, "section": "Termination"},
-                    "importance": "critical",
-                    "risk_level": "high",
-                    "suggestions": ["Clarify notice period requirements"]
-                }
-            ]
-            
-            confidence_scores = {
-                "payment": 0.92,
-                "termination": 0.88
-            }
+            clause_table = _MOCK_CLAUSES
+            clauses = clause_table.to_records()
+            confidence_scores = clause_table.confidence_scores()
             
             risk_assessment = {
                 "overall_risk": "medium",
@@ -190,7 +351,7 @@ class AIService:
             }
             
         except Exception as e:
-            logger.error(f"Error extracting clauses: {str(e)}")
+            logger.error("Error extracting clauses: %s", e)
             raise AIServiceError(f"Failed to extract clauses: {str(e)}")
     
     async def check_compliance(
@@ -208,7 +369,7 @@ class AIService:
         - Remediation steps
         """
         try:
-            logger.info(f"Checking compliance for jurisdiction: {jurisdiction}")
+            logger.info("Checking compliance for jurisdiction: %s", jurisdiction)
             
             # Simulate compliance check (replace with actual AI analysis)
             return {
@@ -219,7 +380,7 @@ class AIService:
                 ],
                 "regulatory_requirements": [
                     {
-                        "id": str(uuid.uuid4()),
+                        "id": _fast_id(),
                         "title": "Indian Contract Act 1872",
                         "description": "Basic contract requirements under Indian law",
                         "jurisdiction": "india",
@@ -227,7 +388,7 @@ class AIService:
                         "compliance": True
                     },
                     {
-                        "id": str(uuid.uuid4()),
+                        "id": _fast_id(),
                         "title": "Consumer Protection Act 2019",
                         "description": "Consumer rights protection requirements",
                         "jurisdiction": "india",
@@ -244,7 +405,7 @@ class AIService:
             }
             
         except Exception as e:
-            logger.error(f"Error checking compliance: {str(e)}")
+            logger.error("Error checking compliance: %s", e)
             raise AIServiceError(f"Failed to check compliance: {str(e)}")
     
     async def search_precedents(
@@ -263,31 +424,11 @@ class AIService:
         - Citation generation
         """
         try:
-            logger.info(f"Searching precedents for query: {query}")
+            logger.info("Searching precedents for query: %s", query)
             
-            # Simulate precedent search (replace with actual search)
-            precedents = [
-                {
-                    "id": str(uuid.uuid4()),
-                    "title": "Relevant Case Law Example 1",
-                    "court": "Supreme Court of India",
-                    "date": "2023-01-15",
-                    "citation": "2023 SCC 1",
-                    "summary": "Case summary related to the query",
-                    "relevance": 0.92,
-                    "url": "https://example.com/case1"
-                },
-                {
-                    "id": str(uuid.uuid4()),
-                    "title": "Relevant Case Law Example 2",
-                    "court": "Delhi High Court",
-                    "date": "2022-11-20",
-                    "citation": "2022 DHC 2",
-                    "summary": "Another relevant case summary",
-                    "relevance": 0.85,
-                    "url": "https://example.com/case2"
-                }
-            ]
+            # Simulate precedent search (replace with actual search); the relevance
+            # values are fixed placeholders, not computed against the query
+            precedents = [{**p, "id": _fast_id()} for p in _PRECEDENT_CORPUS]
             
             return {
                 "precedents": precedents,
@@ -296,88 +437,54 @@ class AIService:
             }
             
         except Exception as e:
-            logger.error(f"Error searching precedents: {str(e)}")
+            logger.error("Error searching precedents: %s", e)
             raise AIServiceError(f"Failed to search precedents: {str(e)}")
     
     def _build_prompt(
         self,
         query: str,
-        context: Optional[str] = None,
+        context: Optional[DocumentContext] = None,
         conversation_history: Optional[List[Dict[str, Any]]] = None
-    ) -> str:
-        """Build AI prompt with context and history."""
-        prompt_parts = []
-        
-        # System message
-        prompt_parts.append(
-            "You are a legal AI assistant specialized in Indian law. "
-            "Provide accurate, helpful responses based on the context provided. "
-            "Always cite sources when available and indicate confidence levels."
-        )
-        
-        # Add conversation history
-        if conversation_history:
-            prompt_parts.append("\\nConversation History:")
-            for msg in conversation_history[-5:]:  # Last 5 messages
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                prompt_parts.append(f"{role.title()}: {content}")
-        
-        # Add context if available
+    ) -> Tuple[str, str]:
+        """Build the (context, query) pair sent to the model: document excerpt, then recent turns."""
+        sections = []
         if context:
-            prompt_parts.append(f"\\nDocument Context:\\n{context[:2000]}...")  # Limit context
-        
-        # Add current query
-        prompt_parts.append(f"\\nUser Query: {query}")
-        prompt_parts.append("\\nAssistant:")
+            sections.append(f"Document Context:\n{context.prompt_excerpt}...")  # Limit context
+        if conversation_history:
+            recent = conversation_history[-5:]  # Last 5 messages
+            sections.append(f"Conversation History:\n{_render_history(recent)}")
         
-        return "\\n".join(prompt_parts)
+        return "\n\n".join(sections), query
     
-    async def _call_ai_model(self, prompt: str) -> str:
-        """Call the AI model (placeholder for actual implementation)."""
-        # This is a placeholder - replace with actual Gemini API call
-        await asyncio.sleep(0.5)  # Simulate API call delay
-        
-        # Generate a mock response based on the prompt
-        if "clause" in prompt.lower():
-            return "Based on the document analysis, I've identified several key clauses including payment terms, termination conditions, and liability limitations. Each clause has been evaluated for risk and compliance with Indian contract law."
-        elif "compliance" in prompt.lower():
-            return "The document shows partial compliance with Indian regulatory requirements. Key areas for improvement include consumer protection clauses and data privacy terms as per recent amendments to Indian laws."
-        elif "precedent" in prompt.lower():
-            return "I found several relevant legal precedents from Indian courts that relate to your query. These cases establish important principles that may apply to your situation."
-        else:
-            return "I understand your legal query. Based on the document and context provided, here's my analysis with relevant legal principles and recommendations."
+    async def _call_ai_model(self, prompt: Tuple[str, str]) -> str:
+        """Call the AI model for a complete reply."""
+        return await llm_client.agenerate(*prompt, system=_SYSTEM_PROMPT)
+    
+    async def _stream_ai_model(self, prompt: Tuple[str, str]) -> AsyncGenerator[str, None]:
+        """Stream the AI model response chunk by chunk."""
+        async for chunk in llm_client.astream(*prompt, system=_SYSTEM_PROMPT):
+            yield chunk
     
-    def _extract_sources(self, context: str) -> List[Dict[str, Any]]:
+    def _extract_sources(self, context: DocumentContext) -> List[Dict[str, Any]]:
         """Extract sources from context."""
         # Placeholder implementation
         return [
             {
-                "id": str(uuid.uuid4()),
+                "id": _fast_id(),
                 "title": "Document Section",
-                "content": context[:200] + "..." if len(context) > 200 else context,
+                "content": context.source_excerpt,
                 "relevance": 0.9
             }
         ]
     
-    def _calculate_confidence(self, response: str, context: Optional[str] = None) -> float:
+    def _calculate_confidence(self, response: str, context: Optional[DocumentContext] = None) -> float:
         """Calculate confidence score for the response."""
         # Simple heuristic - replace with actual confidence calculation
-        base_confidence = 0.8
-        if context and len(context) > 100:
-            base_confidence += 0.1
-        if len(response) > 50:
-            base_confidence += 0.05
-        return min(base_confidence, 0.95)
+        context_length = context.length if context else 0
+        return min(0.8 + 0.1 * (context_length > 100) + 0.05 * (len(response) > 50), 0.95)
     
-    def _generate_suggested_questions(self, query: str, response: str) -> List[str]:
+    def _generate_suggested_questions(self, query: str) -> List[str]:
         """Generate suggested follow-up questions."""
-        suggestions = [
-            "Can you explain this in simpler terms?",
-            "What are the potential risks here?",
-            "Are there any recent legal updates on this topic?",
-            "How does this compare to standard practices?"
-        ]
-        return suggestions[:3]  # Return top 3 suggestions
+        return list(_TOP_SUGGESTIONS)
 # update Sun Jul  6 02:54:59 IST 2025
 # update Sun Jul  6 02:56:34 IST 2025
@@ -3,14 +3,16 @@
 import logging
 import asyncio
 import uuid
+from collections import deque
 from datetime import datetime
 from typing import List, Dict, Any, Optional, AsyncGenerator
+from sqlalchemy import delete, func, insert, tuple_, update
 from sqlalchemy.orm import Session
 
 from ..exceptions import NotFoundError, ValidationError, DatabaseError
 from ..models import ChatSession, ChatMessage, MessageType, User
 from ..schemas import ChatSessionCreate, ChatMessageCreate
-from .ai_service import AIService
+from .ai_service import AIService, DocumentContext
 from .document_service import DocumentService
 
 logger = logging.getLogger(__name__)
@@ -35,55 +37,78 @@ class ChatResponse:
 
 
 class WebSocketManager:
-    """WebSocket connection manager."""
+    """WebSocket connection manager for fan-out to browser clients."""
     
-    def __init__(self):
+    def __init__(self, max_buffered: int = 128):
         self.active_connections: Dict[str, Any] = {}
-        self.message_queues: Dict[str, asyncio.Queue] = {}
+        # Bounded per-client buffers: a stalled client drops its oldest messages
+        # instead of accumulating the whole response in memory.
+        self.max_buffered = max_buffered
+        self.message_buffers: Dict[str, deque] = {}
+        self._waiters: Dict[str, asyncio.Future] = {}
     
     async def connect(self, client_id: str, websocket: Any = None):
         """Register new WebSocket connection."""
         if websocket:
             self.active_connections[client_id] = websocket
-        self.message_queues[client_id] = asyncio.Queue()
+        self.message_buffers[client_id] = deque(maxlen=self.max_buffered)
     
     async def disconnect(self, client_id: str):
         """Remove WebSocket connection."""
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-        if client_id in self.message_queues:
-            del self.message_queues[client_id]
+        self.active_connections.pop(client_id, None)
+        self.message_buffers.pop(client_id, None)
+        self._wake(client_id)
     
     async def send(self, client_id: str, message: Dict[str, Any]):
         """Send message to specific client."""
-        if client_id in self.message_queues:
-            await self.message_queues[client_id].put(message)
+        buffer = self.message_buffers.get(client_id)
+        if buffer is not None:
+            buffer.append(message)
+            self._wake(client_id)
     
     async def listen(self, client_id: str) -> AsyncGenerator[Dict[str, Any], None]:
         """Listen for messages from a specific client."""
-        if client_id not in self.message_queues:
+        if client_id not in self.message_buffers:
             raise ValueError(f"No message queue for client {client_id}")
         
         while True:
-            try:
-                message = await self.message_queues[client_id].get()
-                if message is None:  # Signal to stop
-                    break
-                yield message
-            except asyncio.CancelledError:
+            buffer = self.message_buffers.get(client_id)
+            if buffer is None:  # Disconnected
                 break
-            except Exception as e:
-                logger.error(f"Error in WebSocket listener: {str(e)}")
+            if not buffer:
+                # Park on a single future until the writer appends
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters[client_id] = waiter
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    break
+                continue
+            message = buffer.popleft()
+            if message is None:  # Signal to stop
                 break
+            yield message
+    
+    def _wake(self, client_id: str) -> None:
+        """Resolve the listener's pending future, if any."""
+        waiter = self._waiters.pop(client_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+# Shared across ChatService instances so the AI service's batching, caches and
+# pooled HTTP connections, and the WebSocket fan-out, survive per-request construction
+_AI_SERVICE = AIService()
+_WS_MANAGER = WebSocketManager()
 
 
 class ChatService:
     """Chat service for managing conversations and AI interactions."""
     
     def __init__(self):
-        self.ai_service = AIService()
+        self.ai_service = _AI_SERVICE
         self.document_service = None  # Will be initialized when needed
-        self.websocket_manager = WebSocketManager()
+        self.websocket_manager = _WS_MANAGER
     
     async def create_session(
         self,
@@ -100,21 +125,20 @@ class ChatService:
         - User association
         """
         try:
+            now = datetime.utcnow()
             if not session_name:
-                session_name = f"Session {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}"
+                session_name = f"Session {now.strftime('%Y-%m-%d %H:%M')}"
             
             session = ChatSession(
                 id=uuid.uuid4(),
                 user_id=uuid.UUID(user_id),
                 session_name=session_name,
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
+                created_at=now,
+                updated_at=now
             )
             
             if db:
-                db.add(session)
-                db.commit()
-                db.refresh(session)
+                await asyncio.to_thread(self._commit_new, db, session)
             
             logger.info(f"Created chat session {session.id} for user {user_id}")
             return session
@@ -122,7 +146,7 @@ class ChatService:
         except Exception as e:
             logger.error(f"Error creating chat session: {str(e)}")
             if db:
-                db.rollback()
+                await asyncio.to_thread(db.rollback)
             raise DatabaseError(f"Failed to create chat session: {str(e)}")
     
     async def send_message(
@@ -142,22 +166,23 @@ class ChatService:
         - Error handling
         """
         try:
+            received_at = datetime.utcnow()
+            session_uuid = uuid.UUID(session_id)
+            
             # Validate session exists and belongs to user
-            session = await self._get_session(session_id, user_id, db)
+            session = await self._get_session(session_uuid, uuid.UUID(user_id), db)
             if not session:
                 raise NotFoundError("ChatSession", session_id)
             
-            # Get relevant document context if documents are referenced
-            context = ""
-            if document_ids and self.document_service:
-                context = await self.document_service.get_document_context(
-                    document_ids, message
-                )
-            
-            # Get conversation history
-            chat_history = await self._get_chat_history_for_ai(session_id, db)
+            # Fetch document context and conversation history concurrently
+            context, chat_history = await asyncio.gather(
+                self._get_document_context(document_ids, message),
+                self._get_chat_history_for_ai(session_uuid, db)
+            )
             
-            # Generate AI response with context
+            # Generate AI response with context; near-duplicate questions over the
+            # same documents and recent turns are served from the AI service's
+            # semantic cache
             ai_response = await self.ai_service.generate_response(
                 query=message,
                 context=context,
@@ -165,32 +190,27 @@ class ChatService:
                 user_id=user_id
             )
             
-            # Save user message
+            # Save user message and AI response in a single batched INSERT
             if db:
-                user_msg = ChatMessage(
-                    id=uuid.uuid4(),
-                    session_id=uuid.UUID(session_id),
-                    message_type=MessageType.USER,
-                    content=message,
-                    timestamp=datetime.utcnow()
-                )
-                db.add(user_msg)
-                
-                # Save AI response
-                ai_msg = ChatMessage(
-                    id=uuid.uuid4(),
-                    session_id=uuid.UUID(session_id),
-                    message_type=MessageType.ASSISTANT,
-                    content=ai_response.text,
-                    sources=ai_response.sources,
-                    confidence_score=ai_response.confidence,
-                    timestamp=datetime.utcnow()
-                )
-                db.add(ai_msg)
-                
-                # Update session timestamp
-                session.updated_at = datetime.utcnow()
-                db.commit()
+                replied_at = datetime.utcnow()
+                await asyncio.to_thread(self._save_messages, db, session_uuid, [
+                    {
+                        "session_id": session_uuid,
+                        "message_type": MessageType.USER,
+                        "content": message,
+                        "sources": None,
+                        "confidence_score": None,
+                        "timestamp": received_at
+                    },
+                    {
+                        "session_id": session_uuid,
+                        "message_type": MessageType.ASSISTANT,
+                        "content": ai_response.text,
+                        "sources": ai_response.sources,
+                        "confidence_score": ai_response.confidence,
+                        "timestamp": replied_at
+                    }
+                ], replied_at)
             
             return ChatResponse(
                 success=True,
@@ -202,7 +222,7 @@ class ChatService:
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}")
             if db:
-                db.rollback()
+                await asyncio.to_thread(db.rollback)
             return ChatResponse(
                 success=False,
                 error=f"Failed to process message: {str(e)}"
@@ -226,27 +246,62 @@ class ChatService:
         - Performance optimization
         """
         try:
-            # Initialize streaming session
-            stream_id = str(uuid.uuid4())
-            await self.websocket_manager.connect(stream_id)
-            
-            # Process message in background
-            asyncio.create_task(
-                self._process_stream(
-                    stream_id, session_id, user_id, message, document_ids, db
+            received_at = datetime.utcnow()
+            session_uuid = uuid.UUID(session_id)
+            
+            if not db:
+                yield {"type": "error", "content": "Session not found"}
+                return
+            
+            # Check session ownership, load history and commit the user's message
+            # in one thread hop on the request's session, while fetching document
+            # context; the message is stored before streaming so a disconnect or
+            # model failure mid-stream cannot lose it
+            context, chat_history = await asyncio.gather(
+                self._get_document_context(document_ids, message),
+                asyncio.to_thread(
+                    self._begin_stream_turn, db, session_uuid, uuid.UUID(user_id), {
+                        "session_id": session_uuid,
+                        "message_type": MessageType.USER,
+                        "content": message,
+                        "timestamp": received_at
+                    }
                 )
             )
+            if chat_history is None:
+                yield {"type": "error", "content": "Session not found"}
+                return
+            
+            # Yield AI chunks straight to the caller (no queue hop per chunk)
+            parts: List[str] = []
+            async for chunk in self.ai_service.stream_response(
+                message=message,
+                context=context,
+                chat_history=chat_history,
+                user_id=user_id
+            ):
+                parts.append(chunk)
+                yield {"type": "chunk", "content": chunk}
+            full_response = "".join(parts)
+            
+            # Save the complete AI response
+            if full_response:
+                replied_at = datetime.utcnow()
+                await asyncio.to_thread(self._save_messages, db, session_uuid, [{
+                    "session_id": session_uuid,
+                    "message_type": MessageType.ASSISTANT,
+                    "content": full_response,
+                    "timestamp": replied_at
+                }], replied_at)
+            
+            # Mark end of stream
+            yield {"type": "end"}
             
-            # Stream response chunks
-            async for chunk in self.websocket_manager.listen(stream_id):
-                yield chunk
-                
         except Exception as e:
             logger.error(f"Stream error: {str(e)}")
-            yield {"type": "error", "content": "Stream error occurred"}
-            
-        finally:
-            await self.websocket_manager.disconnect(stream_id)
+            if db:
+                await asyncio.to_thread(db.rollback)
+            yield {"type": "error", "content": "An error occurred while processing your request"}
     
     async def get_chat_history(
         self,
@@ -254,11 +309,17 @@ class ChatService:
         user_id: str,
         limit: int = 20,
         offset: int = 0,
-        db: Session = None
+        db: Session = None,
+        after_ts: Optional[datetime] = None,
+        after_id: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         Retrieve chat history with pagination.
         
+        Pass the last returned message's timestamp and id as ``after_ts`` and
+        ``after_id`` to fetch the next page by keyset instead of ``offset``;
+        the id breaks ties between messages saved in the same instant.
+        
         Features:
         - Pagination support
         - Efficient querying
@@ -268,30 +329,49 @@ class ChatService:
             if not db:
                 return []
             
+            session_uuid = uuid.UUID(session_id)
+            
             # Verify session belongs to user
-            session = db.query(ChatSession).filter(
-                ChatSession.id == uuid.UUID(session_id),
-                ChatSession.user_id == uuid.UUID(user_id)
-            ).first()
+            session = await self._get_session(session_uuid, uuid.UUID(user_id), db)
             
             if not session:
                 raise NotFoundError("ChatSession", session_id)
             
-            # Get messages with pagination
-            messages = db.query(ChatMessage).filter(
-                ChatMessage.session_id == uuid.UUID(session_id)
-            ).order_by(ChatMessage.timestamp.asc()).offset(offset).limit(limit).all()
+            # Get messages with pagination (plain rows, no ORM entity hydration)
+            query = db.query(
+                ChatMessage.id,
+                ChatMessage.message_type,
+                ChatMessage.content,
+                ChatMessage.sources,
+                ChatMessage.confidence_score,
+                ChatMessage.timestamp
+            ).filter(
+                ChatMessage.session_id == session_uuid
+            ).order_by(ChatMessage.timestamp.asc(), ChatMessage.id.asc())
+            if after_ts is not None and after_id:
+                # Keyset page: seek past the (timestamp, id) cursor via the (session_id, timestamp) index
+                query = query.filter(
+                    tuple_(ChatMessage.timestamp, ChatMessage.id) > (after_ts, uuid.UUID(after_id))
+                )
+            elif after_ts is not None:
+                query = query.filter(ChatMessage.timestamp > after_ts)
+            else:
+                query = query.offset(offset)
+            
+            messages = await asyncio.to_thread(
+                query.limit(limit).all
+            )
             
             return [
                 {
-                    "id": str(msg.id),
-                    "type": msg.message_type.value,
-                    "content": msg.content,
-                    "sources": msg.sources,
-                    "confidence": msg.confidence_score,
-                    "timestamp": msg.timestamp.isoformat()
+                    "id": str(msg_id),
+                    "type": message_type.value,
+                    "content": content,
+                    "sources": sources,
+                    "confidence": confidence,
+                    "timestamp": timestamp.isoformat()
                 }
-                for msg in messages
+                for msg_id, message_type, content, sources, confidence, timestamp in messages
             ]
             
         except Exception as e:
@@ -303,16 +383,45 @@ class ChatService:
         user_id: str,
         limit: int = 20,
         offset: int = 0,
-        db: Session = None
+        db: Session = None,
+        before_ts: Optional[datetime] = None,
+        before_id: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """Get user's chat sessions."""
+        """
+        Get user's chat sessions, most recently active first.
+        
+        Sessions sort by ``updated_at`` (``created_at`` until the first
+        update), then id. Pass the last returned session's sort timestamp and
+        id as ``before_ts`` and ``before_id`` to page by keyset.
+        """
         try:
             if not db:
                 return []
             
-            sessions = db.query(ChatSession).filter(
+            last_active = func.coalesce(ChatSession.updated_at, ChatSession.created_at)
+            
+            # Count messages in the same query instead of lazy-loading each session's messages
+            query = db.query(
+                ChatSession.id,
+                ChatSession.session_name,
+                ChatSession.created_at,
+                ChatSession.updated_at,
+                func.count(ChatMessage.id).label("message_count")
+            ).outerjoin(ChatSession.messages).filter(
                 ChatSession.user_id == uuid.UUID(user_id)
-            ).order_by(ChatSession.updated_at.desc()).offset(offset).limit(limit).all()
+            ).group_by(ChatSession.id).order_by(last_active.desc(), ChatSession.id.desc())
+            if before_ts is not None and before_id:
+                query = query.filter(
+                    tuple_(last_active, ChatSession.id) < (before_ts, uuid.UUID(before_id))
+                )
+            elif before_ts is not None:
+                query = query.filter(last_active < before_ts)
+            else:
+                query = query.offset(offset)
+            
+            sessions = await asyncio.to_thread(
+                query.limit(limit).all
+            )
             
             return [
                 {
@@ -320,7 +429,7 @@ class ChatService:
                     "name": session.session_name,
                     "created_at": session.created_at.isoformat(),
                     "updated_at": session.updated_at.isoformat() if session.updated_at else None,
-                    "message_count": len(session.messages)
+                    "message_count": session.message_count
                 }
                 for session in sessions
             ]
@@ -347,23 +456,20 @@ class ChatService:
             if not db:
                 return False
             
-            # Verify session belongs to user
-            session = db.query(ChatSession).filter(
-                ChatSession.id == uuid.UUID(session_id),
-                ChatSession.user_id == uuid.UUID(user_id)
-            ).first()
+            session_uuid = uuid.UUID(session_id)
             
-            if not session:
-                raise NotFoundError("ChatSession", session_id)
-            
-            # Delete messages first (due to foreign key constraints)
-            db.query(ChatMessage).filter(
-                ChatMessage.session_id == uuid.UUID(session_id)
-            ).delete()
+            # Ownership check and delete in one statement; messages go via ON DELETE CASCADE
+            rows = await asyncio.to_thread(
+                self._execute_and_commit,
+                db,
+                delete(ChatSession).where(
+                    ChatSession.id == session_uuid,
+                    ChatSession.user_id == uuid.UUID(user_id)
+                )
+            )
             
-            # Delete session
-            db.delete(session)
-            db.commit()
+            if not rows:
+                raise NotFoundError("ChatSession", session_id)
             
             logger.info(f"Deleted chat session {session_id}")
             return True
@@ -371,27 +477,43 @@ class ChatService:
         except Exception as e:
             logger.error(f"Error deleting session: {str(e)}")
             if db:
-                db.rollback()
+                await asyncio.to_thread(db.rollback)
             return False
     
     async def _get_session(
         self, 
-        session_id: str, 
-        user_id: str, 
+        session_uuid: uuid.UUID, 
+        user_uuid: uuid.UUID, 
         db: Session = None
     ) -> Optional[ChatSession]:
         """Helper method to retrieve and validate session."""
         if not db:
             return None
         
-        return db.query(ChatSession).filter(
-            ChatSession.id == uuid.UUID(session_id),
-            ChatSession.user_id == uuid.UUID(user_id)
-        ).first()
+        return await asyncio.to_thread(
+            db.query(ChatSession).filter(
+                ChatSession.id == session_uuid,
+                ChatSession.user_id == user_uuid
+            ).first
+        )
+    
+    async def _get_document_context(
+        self,
+        document_ids: Optional[List[str]],
+        message: str
+    ) -> Optional[DocumentContext]:
+        """Get relevant document context if documents are referenced."""
+        if not document_ids or not self.document_service:
+            return None
+        
+        context_text = await self.document_service.get_document_context(
+            document_ids, message
+        )
+        return DocumentContext(context_text) if context_text else None
     
     async def _get_chat_history_for_ai(
         self,
-        session_id: str,
+        session_uuid: uuid.UUID,
         db: Session = None,
         limit: int = 10
     ) -> List[Dict[str, Any]]:
@@ -399,8 +521,44 @@ class ChatService:
         if not db:
             return []
         
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == uuid.UUID(session_id)
+        return await asyncio.to_thread(self._recent_history, db, session_uuid, limit)
+    
+    # Blocking database work below is run via asyncio.to_thread so a round-trip
+    # to Postgres never stalls the event loop.
+    
+    @staticmethod
+    def _commit_new(db: Session, instance: Any) -> None:
+        """Insert a new ORM instance and reload its server-generated columns."""
+        db.add(instance)
+        db.commit()
+        db.refresh(instance)
+    
+    @staticmethod
+    def _save_messages(
+        db: Session,
+        session_uuid: uuid.UUID,
+        rows: List[Dict[str, Any]],
+        updated_at: Optional[datetime] = None
+    ) -> None:
+        """Insert chat messages and optionally bump the session timestamp in one transaction."""
+        db.execute(insert(ChatMessage), rows)
+        if updated_at is not None:
+            db.execute(
+                update(ChatSession)
+                .where(ChatSession.id == session_uuid)
+                .values(updated_at=updated_at)
+            )
+        db.commit()
+    
+    @staticmethod
+    def _recent_history(
+        db: Session,
+        session_uuid: uuid.UUID,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Load the session's latest messages, oldest first, as AI history turns."""
+        messages = db.query(ChatMessage.message_type, ChatMessage.content).filter(
+            ChatMessage.session_id == session_uuid
         ).order_by(ChatMessage.timestamp.desc()).limit(limit).all()
         
         # Reverse to get chronological order
@@ -414,89 +572,35 @@ class ChatService:
             for msg in messages
         ]
     
-    async def _process_stream(
-        self,
-        stream_id: str,
-        session_id: str,
-        user_id: str,
-        message: str,
-        document_ids: Optional[List[str]] = None,
-        db: Session = None
-    ) -> None:
-        """Background task to process and stream response."""
-        try:
-            # Validate session
-            session = await self._get_session(session_id, user_id, db)
-            if not session:
-                await self.websocket_manager.send(stream_id, {
-                    "type": "error",
-                    "content": "Session not found"
-                })
-                return
-            
-            # Save user message
-            if db:
-                user_msg = ChatMessage(
-                    id=uuid.uuid4(),
-                    session_id=uuid.UUID(session_id),
-                    message_type=MessageType.USER,
-                    content=message,
-                    timestamp=datetime.utcnow()
-                )
-                db.add(user_msg)
-                db.commit()
-            
-            # Get document context if available
-            context = ""
-            if document_ids and self.document_service:
-                context = await self.document_service.get_document_context(
-                    document_ids, message
-                )
-            
-            # Get conversation history
-            chat_history = await self._get_chat_history_for_ai(session_id, db)
-            
-            # Generate and stream AI response
-            full_response = ""
-            async for chunk in self.ai_service.stream_response(
-                message=message,
-                context=context,
-                chat_history=chat_history,
-                user_id=user_id
-            ):
-                full_response += chunk
-                await self.websocket_manager.send(stream_id, {
-                    "type": "chunk",
-                    "content": chunk
-                })
-            
-            # Save complete AI response
-            if db and full_response:
-                ai_msg = ChatMessage(
-                    id=uuid.uuid4(),
-                    session_id=uuid.UUID(session_id),
-                    message_type=MessageType.ASSISTANT,
-                    content=full_response,
-                    timestamp=datetime.utcnow()
-                )
-                db.add(ai_msg)
-                
-                # Update session timestamp
-                session.updated_at = datetime.utcnow()
-                db.commit()
-            
-            # Mark end of stream
-            await self.websocket_manager.send(stream_id, {
-                "type": "end"
-            })
-            
-        except Exception as e:
-            logger.error(f"Error in stream processing: {str(e)}")
-            await self.websocket_manager.send(stream_id, {
-                "type": "error",
-                "content": "An error occurred while processing your request"
-            })
-        finally:
-            await self.websocket_manager.disconnect(stream_id)
+    @classmethod
+    def _begin_stream_turn(
+        cls,
+        db: Session,
+        session_uuid: uuid.UUID,
+        user_uuid: uuid.UUID,
+        user_row: Dict[str, Any]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return the session's recent history (before this turn) and commit the
+        user's message, or return None if the user does not own the session.
+        """
+        owned = db.query(
+            db.query(ChatSession).filter(
+                ChatSession.id == session_uuid,
+                ChatSession.user_id == user_uuid
+            ).exists()
+        ).scalar()
+        if not owned:
+            return None
+        history = cls._recent_history(db, session_uuid)
+        cls._save_messages(db, session_uuid, [user_row], user_row["timestamp"])
+        return history
+    
+    @staticmethod
+    def _execute_and_commit(db: Session, statement: Any) -> int:
+        """Execute a DML statement, commit, and return the affected row count."""
+        rowcount = db.execute(statement).rowcount
+        db.commit()
+        return rowcount
 # update Sun Jul  6 02:54:59 IST 2025
 # update Sun Jul  6 02:56:34 IST 2025
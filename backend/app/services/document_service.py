@@ -1,20 +1,70 @@
 """Document Service for LegalDoc application."""
 
+import asyncio
 import logging
 import hashlib
+import json
 import uuid
 import os
-from typing import List, Dict, Any, Optional
+from functools import cached_property, lru_cache
+from operator import attrgetter
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
+import numpy as np
 from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from ..core.pdf_extraction import extract_pdf_pages
+from ..core.semantic_cache import quantize_int8
+from ..core.vector_store import get_embedding_model
 from ..exceptions import FileProcessingError, NotFoundError, DuplicateError, ValidationError
 from ..models import Document, User
 from ..schemas import DocumentCreate, DocumentResponse
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=1024)
+def _uuid(value: str) -> uuid.UUID:
+    """Parse a UUID string, memoized for ids that recur across requests."""
+    return uuid.UUID(value)
+
+
+def _remove_if_exists(path: str) -> None:
+    """Delete a file, ignoring one that is already gone (one syscall, no exists() race)."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+_STORAGE_PATH = "uploads"  # Configure as needed
+_EXTRACTION_CACHE_PATH = os.path.join(_STORAGE_PATH, ".extracted")
+_MAX_FILE_SIZE = 50 << 20  # 50MB
+_ALLOWED_TYPES = frozenset({
+    'application/pdf',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/msword',
+    'text/plain'
+})
+
+# Storage directories only need creating once per process
+_storage_ready = False
+
+
+# Columns read by _document_to_dict; querying them directly yields plain rows
+_DOCUMENT_COLUMNS = (
+    Document.id,
+    Document.filename,
+    Document.original_filename,
+    Document.file_hash,
+    Document.file_size,
+    Document.file_type,
+    Document.user_id,
+    Document.created_at,
+    Document.updated_at
+)
+_document_fields = attrgetter(*(column.key for column in _DOCUMENT_COLUMNS))
+
 
 class ExtractedText:
     """Wrapper for extracted text with metadata."""
@@ -29,27 +79,40 @@ class ExtractedText:
         self.content = content
         self.metadata = metadata or {}
         self.page_count = page_count
-        self.word_count = word_count or len(content.split())
+        if word_count:
+            self.word_count = word_count
+    
+    @cached_property
+    def word_count(self) -> int:
+        """Whitespace-separated word count, computed only when first read."""
+        return len(self.content.split())
+    
+    def preview(self, limit: int = 500) -> str:
+        """Leading text of the content, with an ellipsis when truncated."""
+        preview = self.content[:limit]
+        if len(self.content) > limit:
+            preview += "..."
+        return preview
 
 
 class DocumentService:
     """Document service for file management and processing."""
     
     def __init__(self):
-        self.storage_path = "uploads"  # Configure as needed
-        self.max_file_size = 50 * 1024 * 1024  # 50MB
-        self.allowed_types = {
-            'application/pdf',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/msword',
-            'text/plain'
-        }
+        self.storage_path = _STORAGE_PATH
+        self.extraction_cache_path = _EXTRACTION_CACHE_PATH
+        self.max_file_size = _MAX_FILE_SIZE
+        self.upload_chunk_size = 64 * 1024  # 64KB
+        self.upload_chunks_per_write = 8  # Chunks gathered into one writev
+        self.allowed_types = _ALLOWED_TYPES
         self._ensure_storage_path()
     
     def _ensure_storage_path(self):
         """Ensure storage directory exists."""
-        if not os.path.exists(self.storage_path):
-            os.makedirs(self.storage_path)
+        global _storage_ready
+        if not _storage_ready:
+            os.makedirs(self.extraction_cache_path, exist_ok=True)
+            _storage_ready = True
     
     async def upload_document(
         self,
@@ -68,54 +131,56 @@ class DocumentService:
         - Vector embedding (placeholder)
         - Storage management
         """
+        file_path = None
         try:
+            user_uuid = _uuid(user_id)
+            
             # Validate file
             await self._validate_file(file)
             
-            # Calculate file hash for duplicate detection
-            file_content = await file.read()
-            file_hash = hashlib.sha256(file_content).hexdigest()
-            
-            # Check for duplicates
-            if db:
-                existing = db.query(Document).filter(
-                    Document.file_hash == file_hash,
-                    Document.user_id == uuid.UUID(user_id)
-                ).first()
-                
-                if existing:
-                    return {
-                        "message": "Document already exists",
-                        "document": self._document_to_dict(existing),
-                        "is_duplicate": True
-                    }
-            
             # Generate unique filename
             file_extension = self._get_file_extension(file.filename)
             unique_filename = f"{uuid.uuid4()}{file_extension}"
             file_path = os.path.join(self.storage_path, unique_filename)
             
-            # Save file to storage
-            with open(file_path, "wb") as f:
-                f.write(file_content)
+            # Save file to storage, enforcing the size limit and hashing in the same pass
+            file_hash, file_size = await self._receive_file(file, file_path)
+            
+            # Check for duplicates
+            if db:
+                existing = self._find_duplicate(db, user_uuid, file_hash)
+                if existing:
+                    os.remove(file_path)
+                    return self._duplicate_response(existing)
             
-            # Extract text and metadata
-            extracted_text = await self.extract_text(file, file_content)
+            # Extract text and metadata (reused from cache for previously seen content)
+            await file.seek(0)
+            extracted_text = await self.extract_text(file, file_hash=file_hash, file_path=file_path)
             
             # Create document record
             document_data = {
                 "filename": unique_filename,
                 "original_filename": file.filename,
                 "file_hash": file_hash,
-                "file_size": str(len(file_content)),
+                "file_size": str(file_size),
                 "file_type": file.content_type,
-                "user_id": uuid.UUID(user_id)
+                "user_id": user_uuid
             }
             
             if db:
                 document = Document(**document_data)
                 db.add(document)
-                db.commit()
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # A concurrent upload of the same file won the (user_id, file_hash) index
+                    db.rollback()
+                    existing = self._find_duplicate(db, user_uuid, file_hash)
+                    if existing is None:
+                        raise
+                    os.remove(file_path)
+                    return self._duplicate_response(existing)
+                file_path = None  # Stored file now belongs to the document record
                 db.refresh(document)
                 
                 # Generate embeddings in background (placeholder)
@@ -127,7 +192,7 @@ class DocumentService:
                     "message": "Document uploaded successfully",
                     "document": self._document_to_dict(document),
                     "is_duplicate": False,
-                    "text_content": extracted_text.content[:500] + "..." if len(extracted_text.content) > 500 else extracted_text.content,
+                    "text_content": extracted_text.preview(),
                     "metadata": extracted_text.metadata
                 }
             else:
@@ -136,22 +201,31 @@ class DocumentService:
                     "message": "Document processed successfully",
                     "document": document_data,
                     "is_duplicate": False,
-                    "text_content": extracted_text.content[:500] + "..." if len(extracted_text.content) > 500 else extracted_text.content,
+                    "text_content": extracted_text.preview(),
                     "metadata": extracted_text.metadata
                 }
             
         except Exception as e:
             logger.error(f"Error uploading document: {str(e)}")
+            # Don't leave an orphaned upload behind
+            if file_path:
+                _remove_if_exists(file_path)
             raise FileProcessingError(f"Failed to upload document: {str(e)}")
     
     async def extract_text(
         self,
         file: UploadFile,
-        file_content: Optional[bytes] = None
+        file_content: Optional[bytes] = None,
+        file_hash: Optional[str] = None,
+        file_path: Optional[str] = None
     ) -> ExtractedText:
         """
         Extract text from document.
         
+        When ``file_hash`` is given, results are cached on disk by content hash
+        so re-uploads of the same bytes skip parsing. ``file_path`` is where the
+        upload is stored; PDF extraction workers read large files from there.
+        
         Features:
         - Multi-format support
         - OCR capabilities (placeholder)
@@ -159,23 +233,32 @@ class DocumentService:
         - Metadata extraction
         """
         try:
+            if file_hash:
+                cached = await asyncio.to_thread(self._load_cached_extraction, file_hash)
+                if cached is not None:
+                    return cached
+            
             if not file_content:
                 file_content = await file.read()
             
             content_type = file.content_type
             
             if content_type == 'application/pdf':
-                return await self._extract_from_pdf(file_content)
+                extracted = await self._extract_from_pdf(file_content, file_path)
             elif content_type in [
                 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
                 'application/msword'
             ]:
-                return await self._extract_from_docx(file_content)
+                extracted = await self._extract_from_docx(file_content)
             elif content_type == 'text/plain':
-                return await self._extract_from_text(file_content)
+                extracted = await self._extract_from_text(file_content)
             else:
                 raise FileProcessingError(f"Unsupported file type: {content_type}")
             
+            if file_hash:
+                await asyncio.to_thread(self._store_cached_extraction, file_hash, extracted)
+            return extracted
+            
         except Exception as e:
             logger.error(f"Error extracting text: {str(e)}")
             raise FileProcessingError(f"Failed to extract text: {str(e)}")
@@ -224,39 +307,29 @@ class DocumentService:
         text: str,
         chunk_size: int = 1000,
         chunk_overlap: int = 200
-    ) -> List[List[float]]:
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
         """
         Generate vector embeddings.
         
         Features:
         - Chunking strategy
         - Embedding generation
+        - int8 quantization, returned as (codes, per-chunk scales)
         - Vector storage
         - Similarity search
         """
         try:
-            # Placeholder implementation
-            # In a real implementation, this would:
-            # 1. Split text into chunks with overlap
-            # 2. Generate embeddings using OpenAI or similar service
-            # 3. Store embeddings in vector database (FAISS/Pinecone)
-            # 4. Return embedding vectors
-            
             chunks = self._chunk_text(text, chunk_size, chunk_overlap)
-            embeddings = []
             
-            for chunk in chunks:
-                # Simulate embedding generation
-                # embedding = await self.embedding_service.embed(chunk)
-                embedding = [0.1] * 1536  # Placeholder 1536-dimensional embedding
-                embeddings.append(embedding)
+            # One batched encode for all chunks (GPU when available), off the event loop
+            embeddings = await asyncio.to_thread(get_embedding_model().embed_documents, chunks)
             
             logger.info(f"Generated {len(embeddings)} embeddings for text")
-            return embeddings
+            return quantize_int8(np.asarray(embeddings, dtype=np.float32))
             
         except Exception as e:
             logger.error(f"Error generating embeddings: {str(e)}")
-            return []
+            return None
     
     async def get_user_documents(
         self,
@@ -271,14 +344,14 @@ class DocumentService:
             if not db:
                 return []
             
-            query = db.query(Document).filter(Document.user_id == uuid.UUID(user_id))
+            query = db.query(*_DOCUMENT_COLUMNS).filter(Document.user_id == _uuid(user_id))
             
             if search:
                 query = query.filter(
-                    Document.original_filename.ilike(f"%{search}%")
+                    Document.original_filename.icontains(search, autoescape=True)
                 )
             
-            documents = query.offset(skip).limit(limit).all()
+            documents = query.order_by(Document.created_at.desc()).offset(skip).limit(limit).all()
             
             return [self._document_to_dict(doc) for doc in documents]
             
@@ -298,8 +371,8 @@ class DocumentService:
                 return None
             
             document = db.query(Document).filter(
-                Document.id == uuid.UUID(document_id),
-                Document.user_id == uuid.UUID(user_id)
+                Document.id == _uuid(document_id),
+                Document.user_id == _uuid(user_id)
             ).first()
             
             if not document:
@@ -330,22 +403,27 @@ class DocumentService:
                 return False
             
             document = db.query(Document).filter(
-                Document.id == uuid.UUID(document_id),
-                Document.user_id == uuid.UUID(user_id)
+                Document.id == _uuid(document_id),
+                Document.user_id == _uuid(user_id)
             ).first()
             
             if not document:
                 raise NotFoundError("Document", document_id)
             
             # Delete physical file
-            file_path = os.path.join(self.storage_path, document.filename)
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            _remove_if_exists(os.path.join(self.storage_path, document.filename))
             
             # Delete from database
+            file_hash = document.file_hash
             db.delete(document)
             db.commit()
             
+            # Drop the cached plaintext once no remaining document has this content
+            if not db.query(
+                db.query(Document.id).filter(Document.file_hash == file_hash).exists()
+            ).scalar():
+                _remove_if_exists(self._extraction_cache_file(file_hash))
+            
             # TODO: Clean up vector embeddings
             
             logger.info(f"Deleted document {document_id}")
@@ -357,19 +435,92 @@ class DocumentService:
                 db.rollback()
             return False
     
+    def _extraction_cache_file(self, file_hash: str) -> str:
+        """Path of the extraction cache entry for a content hash."""
+        return os.path.join(self.extraction_cache_path, f"{file_hash}.json")
+    
+    def _load_cached_extraction(self, file_hash: str) -> Optional[ExtractedText]:
+        """Load a previously extracted result for this content hash, if cached."""
+        cache_file = self._extraction_cache_file(file_hash)
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return ExtractedText(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable extraction cache entry {file_hash}: {str(e)}")
+            return None
+    
+    def _store_cached_extraction(self, file_hash: str, extracted: ExtractedText) -> None:
+        """Atomically write an extraction result to the content-hash cache."""
+        cache_file = self._extraction_cache_file(file_hash)
+        tmp_file = f"{cache_file}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({
+                    "content": extracted.content,
+                    "metadata": extracted.metadata,
+                    "page_count": extracted.page_count,
+                    "word_count": extracted.word_count
+                }, f)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.warning(f"Could not cache extraction for {file_hash}: {str(e)}")
+            _remove_if_exists(tmp_file)
+    
+    @staticmethod
+    def _find_duplicate(db: Session, user_uuid: uuid.UUID, file_hash: str) -> Optional[Document]:
+        """Return the user's existing document with this content hash, if any."""
+        return db.query(Document).filter(
+            Document.file_hash == file_hash,
+            Document.user_id == user_uuid
+        ).first()
+    
+    def _duplicate_response(self, existing: Document) -> Dict[str, Any]:
+        """Upload result pointing at the document that already holds this content."""
+        return {
+            "message": "Document already exists",
+            "document": self._document_to_dict(existing),
+            "is_duplicate": True
+        }
+    
     async def _validate_file(self, file: UploadFile) -> None:
-        """Validate uploaded file."""
-        # Check file size
-        file_content = await file.read()
-        if len(file_content) > self.max_file_size:
-            raise ValidationError(f"File size exceeds maximum allowed size of {self.max_file_size} bytes")
-        
+        """Validate uploaded file (size is enforced while streaming in _receive_file)."""
         # Check file type
         if file.content_type not in self.allowed_types:
             raise ValidationError(f"File type {file.content_type} is not supported")
-        
-        # Reset file pointer
-        await file.seek(0)
+    
+    async def _receive_file(self, file: UploadFile, file_path: str) -> Tuple[str, int]:
+        """Stream an upload to disk in 64KB chunks, returning its SHA-256 and size."""
+        hasher = hashlib.sha256(usedforsecurity=False)
+        total = 0
+        pending: List[bytes] = []
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while chunk := await file.read(self.upload_chunk_size):
+                total += len(chunk)
+                if total > self.max_file_size:
+                    raise ValidationError(f"File size exceeds maximum allowed size of {self.max_file_size} bytes")
+                hasher.update(chunk)
+                pending.append(chunk)
+                if len(pending) >= self.upload_chunks_per_write:
+                    # One vectored write per batch, off the event loop
+                    await asyncio.to_thread(self._write_chunks, fd, pending)
+                    pending = []
+            if pending:
+                await asyncio.to_thread(self._write_chunks, fd, pending)
+        finally:
+            os.close(fd)
+        return hasher.hexdigest(), total
+    
+    @staticmethod
+    def _write_chunks(fd: int, chunks: List[bytes]) -> None:
+        """Write all chunks to fd with a single writev, finishing any short write."""
+        written = os.writev(fd, chunks)
+        if written < sum(map(len, chunks)):
+            remaining = memoryview(b"".join(chunks))[written:]
+            while remaining:
+                remaining = remaining[os.write(fd, remaining):]
     
     def _get_file_extension(self, filename: str) -> str:
         """Get file extension from filename."""
@@ -377,23 +528,18 @@ class DocumentService:
             return ""
         return os.path.splitext(filename)[1]
     
-    async def _extract_from_pdf(self, file_content: bytes) -> ExtractedText:
-        """Extract text from PDF file."""
+    async def _extract_from_pdf(self, file_content: bytes, file_path: Optional[str] = None) -> ExtractedText:
+        """Extract text from PDF file, given its stored path when there is one."""
         try:
-            import io
-            from pypdf import PdfReader
-            
-            # Create a BytesIO object from the file content
-            pdf_file = io.BytesIO(file_content)
-            reader = PdfReader(pdf_file)
+            page_texts, extraction_method = await extract_pdf_pages(file_content, file_path)
+            page_count = len(page_texts)
             
-            text = ""
-            page_count = len(reader.pages)
+            if logger.isEnabledFor(logging.DEBUG):
+                for page_num, page_text in enumerate(page_texts):
+                    logger.debug(f"Extracted {len(page_text)} chars from page {page_num + 1}")
             
-            for page_num, page in enumerate(reader.pages):
-                page_text = page.extract_text()
-                text += page_text + "\n"
-                logger.info(f"Extracted {len(page_text)} chars from page {page_num + 1}")
+            # Join once instead of growing a single string page by page
+            text = "".join(f"{page_text}\n" for page_text in page_texts)
             
             logger.info(f"Total extracted text length: {len(text)} characters")
             logger.info(f"Text preview (first 200 chars): {text[:200]}...")
@@ -401,7 +547,7 @@ class DocumentService:
             metadata = {
                 "format": "pdf",
                 "pages": page_count,
-                "extraction_method": "pypdf"
+                "extraction_method": extraction_method
             }
             
             return ExtractedText(content=text, metadata=metadata, page_count=page_count)
@@ -421,9 +567,7 @@ class DocumentService:
                 doc = DocxDocument(docx_file)
                 
                 # Extract text from all paragraphs
-                text = ""
-                for paragraph in doc.paragraphs:
-                    text += paragraph.text + "\n"
+                text = "".join(f"{paragraph.text}\n" for paragraph in doc.paragraphs)
                 
                 logger.info(f"Total extracted text length: {len(text)} characters")
                 logger.info(f"Text preview (first 200 chars): {text[:200]}...")
@@ -469,32 +613,29 @@ class DocumentService:
         chunk_overlap: int = 200
     ) -> List[str]:
         """Split text into overlapping chunks."""
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            start = end - chunk_overlap
-            
-            if start >= len(text):
-                break
+        step = chunk_size - chunk_overlap
+        if step <= 0:
+            raise ValidationError("chunk_overlap must be smaller than chunk_size")
         
-        return chunks
+        # Chunk starts are a fixed stride; each slice is a single C-level copy
+        return [text[start:start + chunk_size] for start in range(0, len(text), step)]
     
     def _document_to_dict(self, document: Document) -> Dict[str, Any]:
-        """Convert document model to dictionary."""
+        """Convert a document model (or a row of _DOCUMENT_COLUMNS) to dictionary."""
+        (
+            document_id, filename, original_filename, file_hash, file_size,
+            file_type, user_id, created_at, updated_at
+        ) = _document_fields(document)
         return {
-            "id": str(document.id),
-            "filename": document.filename,
-            "original_filename": document.original_filename,
-            "file_hash": document.file_hash,
-            "file_size": document.file_size,
-            "file_type": document.file_type,
-            "user_id": str(document.user_id),
-            "created_at": document.created_at.isoformat(),
-            "updated_at": document.updated_at.isoformat() if document.updated_at else None
+            "id": str(document_id),
+            "filename": filename,
+            "original_filename": original_filename,
+            "file_hash": file_hash,
+            "file_size": file_size,
+            "file_type": file_type,
+            "user_id": str(user_id),
+            "created_at": created_at.isoformat(),
+            "updated_at": updated_at.isoformat() if updated_at else None
         }
 # update Sun Jul  6 02:54:59 IST 2025
 # update Sun Jul  6 02:56:34 IST 2025
@@ -1,4 +1,4 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, Hashable, List, Any, Optional, Set
 import re
 import os
 import sys
@@ -7,14 +7,97 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from ..schemas import ClauseExtractionResponse, ComplianceCheckResponse, PrecedentSearchResponse
+from .llm_cache import cached_query
 
 try:
-    from llm.client import query
+    from llm.client import query as llm_query
 except ImportError:
     # Fallback import if the module structure is different
-    def query(context: str, prompt: str) -> str:
+    def llm_query(context: str, prompt: str, system: Optional[str] = None) -> str:
         return "Legal analysis service is currently unavailable. Please check the Gemini API configuration."
 
+try:
+    # RE2 matches in linear time with no backtracking; the patterns below use
+    # only syntax it supports
+    import re2 as _regex
+except ImportError:
+    _regex = re
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Precedent parsing patterns, compiled once at import
+_CASE_NAME_RE = _regex.compile(r'([A-Z][a-zA-Z\s&]+)\s+vs?\.?\s+([A-Z][a-zA-Z\s&]+)')
+_YEAR_RE = _regex.compile(r'\b(?:19|20)\d{2}\b')
+_HIGH_COURT_STATES = ("Delhi", "Bombay", "Madras", "Calcutta", "Karnataka", "Punjab")
+_COURT_RE = _regex.compile(r'Supreme Court|(?:(' + '|'.join(_HIGH_COURT_STATES) + r') )?High Court')
+_CITATION_RES = (
+    _regex.compile(r'\(\d{4}\)\s+\d+\s+SCC\s+\d+'),
+    _regex.compile(r'AIR\s+\d{4}\s+SC\s+\d+'),
+    _regex.compile(r'\d{4}\s+\(\d+\)\s+SCC\s+\d+')
+)
+
+
+class _KeywordScanner:
+    """
+    Finds which labels have a keyword in a lowercased text.
+    
+    With pyahocorasick installed all keywords are matched in one pass over the
+    text (overlapping matches included); otherwise each keyword is a substring test.
+    """
+    
+    def __init__(self, keywords: Dict[str, Hashable]):
+        self._keywords = keywords
+        self._automaton = None
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for keyword, label in keywords.items():
+                automaton.add_word(keyword, label)
+            automaton.make_automaton()
+            self._automaton = automaton
+    
+    def labels(self, text_lower: str) -> Set[Hashable]:
+        if self._automaton is not None:
+            return {label for _, label in self._automaton.iter(text_lower)}
+        return {label for keyword, label in self._keywords.items() if keyword in text_lower}
+
+# Below this much text (or for extraction placeholders) there is nothing for the
+# model to analyze, so the LLM call is skipped. Same threshold at which
+# _generate_recommendations already flags a document as brief.
+_MIN_ANALYSIS_CHARS = 1000
+_META_ONLY_RE = re.compile(r'^\s*(?:%PDF|Unable to extract)')
+
+
+# The client sends at most this much context; excerpts are cut to fit it exactly
+_EXCERPT_CHARS = 2500
+
+
+def _document_excerpt(document_content: str) -> str:
+    """Leading part of a document that fits the context slot, ending on a word boundary."""
+    if len(document_content) <= _EXCERPT_CHARS:
+        return document_content
+    excerpt = document_content[:_EXCERPT_CHARS]
+    cut = max(excerpt.rfind(" "), excerpt.rfind("\n"))
+    return excerpt[:cut] if cut > 0 else excerpt
+
+
+def _lacks_content(document_content: str) -> bool:
+    """True when a document is too short or only extraction residue."""
+    return len(document_content.strip()) < _MIN_ANALYSIS_CHARS or bool(_META_ONLY_RE.match(document_content))
+
+
+class _ParsedResponse:
+    """AI response with its lowercased text and lines, computed once for all parsers."""
+    
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.lower = raw.lower()
+        self.lines = raw.split('\n')
+        self.lines_lower = self.lower.split('\n')
+
+
 class ClauseExtractor:
     """Service for extracting and analyzing legal clauses from documents"""
     
@@ -30,15 +113,8 @@ class ClauseExtractor:
         "arbitration": ["arbitration", "arbitrator", "alternative dispute resolution"]
     }
     
-    def extract_clauses(self, document_content: str, document_id: Optional[str] = None) -> ClauseExtractionResponse:
-        """Extract legal clauses from document content"""
-        
-        # Use AI to identify and extract clauses
-        prompt = f"""
-        Analyze the following legal document and extract key clauses. Focus on Indian legal standards and practices.
-
-        Document Content:
-        {document_content[:3000]}  # Limit content to avoid token limits
+    _STATIC_PROMPT = """
+        Analyze the legal document given as context and extract key clauses. Focus on Indian legal standards and practices.
 
         Extract and analyze the following types of clauses:
         1. TERMINATION CLAUSES - How and when the agreement can be terminated
@@ -61,11 +137,33 @@ class ClauseExtractor:
 
         Format your response as a structured analysis with clear sections for each clause type.
         """
+    
+    def extract_clauses(self, document_content: str, document_id: Optional[str] = None) -> ClauseExtractionResponse:
+        """Extract legal clauses from document content"""
         
-        ai_response = query("", prompt)
+        if _lacks_content(document_content):
+            return ClauseExtractionResponse(
+                clauses=[],
+                confidence_scores={},
+                risk_assessment={
+                    "overall_risk": "Low - Insufficient content",
+                    "high_risk_count": 0,
+                    "medium_risk_count": 0,
+                    "missing_clauses": "None"
+                },
+                recommendations=["Document too short for clause extraction"]
+            )
+        
+        # Use AI to identify and extract clauses; the document goes last so the
+        # static instructions form a stable prefix
+        excerpt = _document_excerpt(document_content)
+        ai_response = cached_query(
+            llm_query, excerpt, "Extract and analyze the clauses in this document.",
+            system=self._STATIC_PROMPT
+        )
         
         # Parse AI response and extract structured data
-        clauses = self._parse_clause_response(ai_response)
+        clauses = self._parse_clause_response(_ParsedResponse(ai_response))
         confidence_scores = self._calculate_confidence_scores(clauses)
         risk_assessment = self._assess_risks(clauses)
         recommendations = self._generate_recommendations(clauses, document_content)
@@ -77,9 +175,11 @@ class ClauseExtractor:
             recommendations=recommendations
         )
     
-    def _parse_clause_response(self, ai_response: str) -> List[Dict[str, Any]]:
+    def _parse_clause_response(self, response: _ParsedResponse) -> List[Dict[str, Any]]:
         """Parse AI response into structured clause data"""
         clauses = []
+        mentioned = _CLAUSE_SCANNER.labels(response.lower)
+        contexts = self._get_clause_contexts(response, mentioned)
         
         # Basic parsing - in production, this would be more sophisticated
         for clause_type in self.CLAUSE_TYPES.keys():
@@ -92,47 +192,52 @@ class ClauseExtractor:
             }
             
             # Search for clause mentions in AI response
-            if clause_type.replace("_", " ") in ai_response.lower():
+            if clause_type in mentioned:
                 clause_data["found"] = True
-                clause_data["risk_level"] = self._extract_risk_level(ai_response, clause_type)
-                clause_data["explanation"] = self._extract_explanation(ai_response, clause_type)
+                context = contexts.get(clause_type, "")
+                clause_data["risk_level"] = self._extract_risk_level(context)
+                clause_data["explanation"] = self._extract_explanation(context, clause_type)
             
             clauses.append(clause_data)
         
         return clauses
     
-    def _extract_risk_level(self, response: str, clause_type: str) -> str:
-        """Extract risk level for a clause from AI response"""
+    def _extract_risk_level(self, context: str) -> str:
+        """Extract risk level for a clause from its context in the AI response"""
         # Simple pattern matching - could be improved with NLP
-        context = self._get_clause_context(response, clause_type)
+        context_lower = context.lower()
         
-        if any(word in context.lower() for word in ["high risk", "problematic", "concerning", "missing"]):
+        if any(word in context_lower for word in ["high risk", "problematic", "concerning", "missing"]):
             return "High"
-        elif any(word in context.lower() for word in ["medium risk", "moderate", "review"]):
+        elif any(word in context_lower for word in ["medium risk", "moderate", "review"]):
             return "Medium"
         else:
             return "Low"
     
-    def _extract_explanation(self, response: str, clause_type: str) -> str:
-        """Extract explanation for a clause from AI response"""
-        context = self._get_clause_context(response, clause_type)
+    def _extract_explanation(self, context: str, clause_type: str) -> str:
+        """Extract explanation for a clause from its context in the AI response"""
         # Return first few sentences that mention the clause
         sentences = context.split('. ')
         relevant_sentences = [s for s in sentences if clause_type.replace("_", " ") in s.lower()]
         return '. '.join(relevant_sentences[:2]) if relevant_sentences else "No specific explanation found."
     
-    def _get_clause_context(self, response: str, clause_type: str) -> str:
-        """Get relevant context for a clause type from the response"""
-        lines = response.split('\n')
-        clause_name = clause_type.replace("_", " ").title()
+    def _get_clause_contexts(self, response: _ParsedResponse, clause_types: Set[str]) -> Dict[str, str]:
+        """Get relevant context for each clause type from the response in one pass over its lines"""
+        lines = response.lines
+        pending = {clause_type: clause_type.replace("_", " ").title() for clause_type in clause_types}
+        contexts = {}
         
         for i, line in enumerate(lines):
-            if clause_name in line or clause_type in line.lower():
-                # Return this line and next few lines as context
-                context_lines = lines[i:i+5]
-                return ' '.join(context_lines)
-        
-        return ""
+            if not pending:
+                break
+            line_lower = response.lines_lower[i]
+            for clause_type, clause_name in list(pending.items()):
+                if clause_name in line or clause_type in line_lower:
+                    # This line and next few lines as context, from the first matching line
+                    contexts[clause_type] = ' '.join(lines[i:i+5])
+                    del pending[clause_type]
+        
+        return contexts
     
     def _calculate_confidence_scores(self, clauses: List[Dict[str, Any]]) -> Dict[str, float]:
         """Calculate confidence scores for extracted clauses"""
@@ -188,7 +293,7 @@ class ClauseExtractor:
             recommendations.append("Review and revise high-risk clauses identified above")
         
         # Document length check
-        if len(document_content) < 1000:
+        if len(document_content) < _MIN_ANALYSIS_CHARS:
             recommendations.append("Document appears brief - consider adding more detailed terms and conditions")
         
         # Generic recommendations
@@ -214,14 +319,8 @@ class ComplianceChecker:
         "data_protection": "Personal Data Protection Act (Proposed)"
     }
     
-    def check_compliance(self, document_content: str, jurisdiction: str = "india", document_id: Optional[str] = None) -> ComplianceCheckResponse:
-        """Check document compliance with relevant regulations"""
-        
-        prompt = f"""
-        Review the following legal document for compliance with Indian laws and regulations.
-
-        Document Content:
-        {document_content[:3000]}
+    _STATIC_PROMPT = """
+        Review the legal document given as context for compliance with Indian laws and regulations.
 
         Check compliance with:
         1. Indian Contract Act, 1872
@@ -241,15 +340,32 @@ class ComplianceChecker:
 
         Provide specific recommendations for ensuring compliance.
         """
+    
+    def check_compliance(self, document_content: str, jurisdiction: str = "india", document_id: Optional[str] = None) -> ComplianceCheckResponse:
+        """Check document compliance with relevant regulations"""
         
-        ai_response = query("", prompt)
+        if _lacks_content(document_content):
+            return ComplianceCheckResponse(
+                compliance_status="Requires Review",
+                missing_clauses=[],
+                regulatory_requirements=[],
+                recommendations=["Document too short for compliance review"],
+                confidence_score=0.0
+            )
+        
+        excerpt = _document_excerpt(document_content)
+        ai_response = cached_query(
+            llm_query, excerpt, "Review this document for compliance.",
+            system=self._STATIC_PROMPT
+        )
         
         # Parse compliance analysis
-        compliance_status = self._determine_compliance_status(ai_response)
-        missing_clauses = self._extract_missing_clauses(ai_response)
-        regulatory_requirements = self._extract_regulatory_requirements(ai_response)
-        recommendations = self._extract_compliance_recommendations(ai_response)
-        confidence_score = self._calculate_compliance_confidence(ai_response)
+        response = _ParsedResponse(ai_response)
+        compliance_status = self._determine_compliance_status(response)
+        missing_clauses = self._extract_missing_clauses(response)
+        regulatory_requirements = self._extract_regulatory_requirements(response)
+        recommendations = self._extract_compliance_recommendations(response)
+        confidence_score = self._calculate_compliance_confidence(response)
         
         return ComplianceCheckResponse(
             compliance_status=compliance_status,
@@ -259,38 +375,40 @@ class ComplianceChecker:
             confidence_score=confidence_score
         )
     
-    def _determine_compliance_status(self, ai_response: str) -> str:
+    def _determine_compliance_status(self, response: _ParsedResponse) -> str:
         """Determine overall compliance status from AI response"""
-        response_lower = ai_response.lower()
+        found = _STATUS_SCANNER.labels(response.lower)
         
-        if any(word in response_lower for word in ["non-compliant", "violations", "serious issues"]):
+        if "Non-Compliant" in found:
             return "Non-Compliant"
-        elif any(word in response_lower for word in ["partially compliant", "some issues", "minor violations"]):
+        elif "Partially Compliant" in found:
             return "Partially Compliant"
-        elif any(word in response_lower for word in ["compliant", "meets requirements", "satisfactory"]):
+        elif "Compliant" in found:
             return "Compliant"
         else:
             return "Requires Review"
     
-    def _extract_missing_clauses(self, ai_response: str) -> List[str]:
+    def _extract_missing_clauses(self, response: _ParsedResponse) -> List[str]:
         """Extract missing clauses from AI response"""
         missing_clauses = []
         
         # Look for patterns indicating missing clauses
-        lines = ai_response.split('\n')
-        for line in lines:
-            if "missing" in line.lower() or "add" in line.lower() or "required" in line.lower():
-                if any(word in line.lower() for word in ["clause", "provision", "term"]):
+        for line, line_lower in zip(response.lines, response.lines_lower):
+            if "missing" in line_lower or "add" in line_lower or "required" in line_lower:
+                if any(word in line_lower for word in ["clause", "provision", "term"]):
                     missing_clauses.append(line.strip())
+                    if len(missing_clauses) >= 5:  # Limit to top 5
+                        break
         
-        return missing_clauses[:5]  # Limit to top 5
+        return missing_clauses
     
-    def _extract_regulatory_requirements(self, ai_response: str) -> List[Dict[str, Any]]:
+    def _extract_regulatory_requirements(self, response: _ParsedResponse) -> List[Dict[str, Any]]:
         """Extract regulatory requirements from AI response"""
         requirements = []
+        mentioned = {label[1] for label in _REGULATION_SCANNER.labels(response.lower)}
         
         for reg_key, reg_name in self.INDIAN_REGULATIONS.items():
-            if reg_name.lower() in ai_response.lower() or reg_key in ai_response.lower():
+            if reg_key in mentioned:
                 requirements.append({
                     "regulation": reg_name,
                     "applicable": True,
@@ -300,16 +418,18 @@ class ComplianceChecker:
         
         return requirements
     
-    def _extract_compliance_recommendations(self, ai_response: str) -> List[str]:
+    def _extract_compliance_recommendations(self, response: _ParsedResponse) -> List[str]:
         """Extract compliance recommendations from AI response"""
         recommendations = []
         
         # Look for recommendation patterns
-        lines = ai_response.split('\n')
-        for line in lines:
-            if any(word in line.lower() for word in ["recommend", "should", "must", "ensure", "consider"]):
-                if len(line.strip()) > 10:  # Avoid very short lines
-                    recommendations.append(line.strip())
+        for line, line_lower in zip(response.lines, response.lines_lower):
+            if any(word in line_lower for word in ["recommend", "should", "must", "ensure", "consider"]):
+                line = line.strip()
+                if len(line) > 10:  # Avoid very short lines
+                    recommendations.append(line)
+                    if len(recommendations) >= 8:  # Defaults below would be cut anyway
+                        break
         
         # Add default recommendations
         recommendations.extend([
@@ -320,37 +440,49 @@ class ComplianceChecker:
         
         return recommendations[:8]  # Limit to reasonable number
     
-    def _calculate_compliance_confidence(self, ai_response: str) -> float:
+    def _calculate_compliance_confidence(self, response: _ParsedResponse) -> float:
         """Calculate confidence score for compliance analysis"""
         # Simple scoring based on response detail and specific mentions
         score = 0.5  # Base score
         
-        if len(ai_response) > 500:  # Detailed response
+        if len(response.raw) > 500:  # Detailed response
             score += 0.2
         
-        regulation_mentions = sum(1 for reg in self.INDIAN_REGULATIONS.values() if reg.lower() in ai_response.lower())
+        regulation_mentions = sum(1 for kind, _ in _REGULATION_SCANNER.labels(response.lower) if kind == "name")
         score += min(regulation_mentions * 0.1, 0.2)
         
-        if "compliant" in ai_response.lower():
+        if "compliant" in response.lower:
             score += 0.1
         
         return min(score, 0.9)  # Cap at 0.9
 
 
+_CLAUSE_SCANNER = _KeywordScanner({
+    clause_type.replace("_", " "): clause_type for clause_type in ClauseExtractor.CLAUSE_TYPES
+})
+_STATUS_SCANNER = _KeywordScanner({
+    "non-compliant": "Non-Compliant",
+    "violations": "Non-Compliant",
+    "serious issues": "Non-Compliant",
+    "partially compliant": "Partially Compliant",
+    "some issues": "Partially Compliant",
+    "minor violations": "Partially Compliant",
+    "compliant": "Compliant",
+    "meets requirements": "Compliant",
+    "satisfactory": "Compliant"
+})
+# Labels are (kind, key): a regulation counts as mentioned by full name or by key
+_REGULATION_SCANNER = _KeywordScanner({
+    **{reg_key: ("key", reg_key) for reg_key in ComplianceChecker.INDIAN_REGULATIONS},
+    **{reg_name.lower(): ("name", reg_key) for reg_key, reg_name in ComplianceChecker.INDIAN_REGULATIONS.items()}
+})
+
+
 class PrecedentEngine:
     """Service for finding relevant legal precedents"""
     
-    def find_relevant_precedents(self, query: str, jurisdiction: str = "india", document_type: Optional[str] = None) -> PrecedentSearchResponse:
-        """Find relevant legal precedents for the given query"""
-        
-        # In a production system, this would query actual legal databases
-        # For now, we'll use AI to suggest relevant precedents
-        
-        prompt = f"""
-        Find relevant Indian legal precedents for the following query:
-        Query: {query}
-        Jurisdiction: {jurisdiction}
-        Document Type: {document_type or "General"}
+    _STATIC_PROMPT = """
+        Find relevant Indian legal precedents for the query given in the question.
 
         Provide information about:
         1. Relevant Supreme Court cases
@@ -367,8 +499,24 @@ class PrecedentEngine:
 
         Format each precedent with proper legal citation.
         """
+    
+    def find_relevant_precedents(self, query: str, jurisdiction: str = "india", document_type: Optional[str] = None) -> PrecedentSearchResponse:
+        """Find relevant legal precedents for the given query"""
+        
+        # In a production system, this would query actual legal databases
+        # For now, we'll use AI to suggest relevant precedents
+        
+        prompt = f"""
+        Query: {query}
+        Jurisdiction: {jurisdiction}
+        Document Type: {document_type or "General"}
+        """
         
-        ai_response = query("", prompt)
+        ai_response = cached_query(
+            llm_query, "", prompt,
+            system=self._STATIC_PROMPT,
+            scope=("precedent", jurisdiction, document_type), semantic_text=query
+        )
         
         # Parse precedent information
         precedents = self._parse_precedents(ai_response)
@@ -390,64 +538,57 @@ class PrecedentEngine:
         
         for section in sections:
             if any(word in section for word in ['v.', 'vs.', 'Supreme Court', 'High Court', 'AIR', 'SCC']):
-                precedent = {
-                    "case_name": self._extract_case_name(section),
+                # Only add if we found a case name; other fields are extracted only then
+                case_name = self._extract_case_name(section)
+                if not case_name:
+                    continue
+                
+                precedents.append({
+                    "case_name": case_name,
                     "court": self._extract_court(section),
                     "year": self._extract_year(section),
                     "citation": self._extract_citation(section),
                     "legal_principle": self._extract_principle(section),
                     "relevance": self._extract_relevance(section),
                     "summary": section[:200] + "..." if len(section) > 200 else section
-                }
-                
-                if precedent["case_name"]:  # Only add if we found a case name
-                    precedents.append(precedent)
+                })
+                if len(precedents) >= 5:  # Limit to top 5
+                    break
         
-        return precedents[:5]  # Limit to top 5
+        return precedents
     
     def _extract_case_name(self, text: str) -> str:
         """Extract case name from text"""
-        # Look for common case name patterns
-        patterns = [
-            r'([A-Z][a-zA-Z\s&]+)\s+v\.?\s+([A-Z][a-zA-Z\s&]+)',
-            r'([A-Z][a-zA-Z\s&]+)\s+vs\.?\s+([A-Z][a-zA-Z\s&]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                return f"{match.group(1)} v. {match.group(2)}"
+        match = _CASE_NAME_RE.search(text)
+        if match:
+            return f"{match.group(1)} v. {match.group(2)}"
         
         return ""
     
     def _extract_court(self, text: str) -> str:
         """Extract court name from text"""
-        if "Supreme Court" in text:
+        # One scan collects every court mention; priority is applied afterwards
+        found = {match.group(1) or match.group(0) for match in _COURT_RE.finditer(text)}
+        if "Supreme Court" in found:
             return "Supreme Court of India"
-        elif "High Court" in text:
-            # Try to find specific high court
-            for state in ["Delhi", "Bombay", "Madras", "Calcutta", "Karnataka", "Punjab"]:
-                if f"{state} High Court" in text:
-                    return f"{state} High Court"
+        # Try to find specific high court
+        for state in _HIGH_COURT_STATES:
+            if state in found:
+                return f"{state} High Court"
+        if "High Court" in found:
             return "High Court"
         return "Unknown"
     
     def _extract_year(self, text: str) -> str:
         """Extract year from text"""
-        year_match = re.search(r'\b(19|20)\d{2}\b', text)
+        year_match = _YEAR_RE.search(text)
         return year_match.group(0) if year_match else ""
     
     def _extract_citation(self, text: str) -> str:
         """Extract legal citation from text"""
         # Look for common citation patterns
-        patterns = [
-            r'\(\d{4}\)\s+\d+\s+SCC\s+\d+',
-            r'AIR\s+\d{4}\s+SC\s+\d+',
-            r'\d{4}\s+\(\d+\)\s+SCC\s+\d+'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
+        for pattern in _CITATION_RES:
+            match = pattern.search(text)
             if match:
                 return match.group(0)
         
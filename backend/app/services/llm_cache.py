@@ -0,0 +1,145 @@
+"""Content-addressed disk cache for LLM responses in LegalDoc application."""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, FrozenSet, Hashable, Optional
+
+from ..core.semantic_cache import SemanticCache
+
+logger = logging.getLogger(__name__)
+
+# Bump when prompts or response parsing change so old entries stop matching
+PROMPT_VERSION = "v2"
+
+# Opt-in: without a cache directory every call goes straight to the model
+CACHE_DIR: Optional[str] = os.getenv("LEGAL_LLM_CACHE") or None
+
+# Fallback and error texts returned by the client; these are never cached
+_UNCACHEABLE_PREFIXES = (
+    "Error:",
+    "Request timed out",
+    "Sorry, the language model",
+    "Legal analysis service is currently unavailable",
+)
+
+# Paraphrased queries must be this similar in embedding space *and* share this
+# much vocabulary to reuse an answer; the token check catches short queries that
+# differ only in a section or statute that embeddings score as the same. Only
+# share-safe text (precedent search queries) belongs here: document excerpts
+# that differ just in parties or amounts still pass both checks.
+SEMANTIC_THRESHOLD = 0.95
+MIN_TOKEN_OVERLAP = 0.7
+
+_semantic_cache = SemanticCache(threshold=SEMANTIC_THRESHOLD, max_scopes=64)
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def cache_key(*parts: str) -> str:
+    """SHA-256 over length-prefixed parts, so ("ab", "c") and ("a", "bc") differ."""
+    digest = hashlib.sha256(usedforsecurity=False)
+    for part in (PROMPT_VERSION, *parts):
+        data = part.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _cache_file(key: str) -> str:
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _load(key: str) -> Optional[str]:
+    try:
+        with open(_cache_file(key), "r", encoding="utf-8") as f:
+            return json.load(f)["response"]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable LLM cache entry {key}: {str(e)}")
+        return None
+
+
+def _store(key: str, response: str) -> None:
+    cache_file = _cache_file(key)
+    tmp_file = f"{cache_file}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "response": response,
+                "ts_utc": datetime.now(timezone.utc).isoformat()
+            }, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.warning(f"Could not cache LLM response {key}: {str(e)}")
+        try:
+            os.remove(tmp_file)
+        except FileNotFoundError:
+            pass
+
+
+def _tokens(text: str) -> FrozenSet[str]:
+    return frozenset(_TOKEN_RE.findall(text.lower()))
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union else 1.0
+
+
+def cached_query(
+    query: Callable[..., str],
+    context: str,
+    prompt: str,
+    system: Optional[str] = None,
+    scope: Optional[Hashable] = None,
+    semantic_text: Optional[str] = None
+) -> str:
+    """
+    Call query(context, prompt, system=system), reusing a stored response for
+    identical input.
+
+    The key covers the prompt version, the system prompt the client will send,
+    the context and the prompt. Error responses pass through uncached.
+
+    With a scope and semantic_text (the variable part of the prompt, e.g. the
+    search query), an exact miss falls back to the in-memory semantic cache for
+    that scope before calling the model. Never pass user document text here:
+    the semantic cache is shared across users.
+    """
+    key = None
+    if CACHE_DIR is not None:
+        key = cache_key(system or os.environ.get("SYSTEM_PROMPT", ""), context, prompt)
+        response = _load(key)
+        if response is not None:
+            logger.debug(f"LLM cache hit {key}")
+            return response
+
+    embedding = tokens = None
+    if scope is not None and semantic_text:
+        embedding = _semantic_cache.embed(semantic_text)
+        tokens = _tokens(semantic_text)
+        if embedding is not None:
+            cached = _semantic_cache.lookup(scope, embedding)
+            if cached is not None:
+                cached_tokens, response = cached
+                if _jaccard(tokens, cached_tokens) >= MIN_TOKEN_OVERLAP:
+                    logger.debug(f"LLM semantic cache hit in {scope}")
+                    return response
+                logger.debug(
+                    f"LLM semantic near-miss in {scope}; differing terms: "
+                    f"{sorted(tokens ^ cached_tokens)[:10]}"
+                )
+
+    response = query(context, prompt, system=system)
+    if not response.startswith(_UNCACHEABLE_PREFIXES):
+        if key is not None:
+            _store(key, response)
+        if embedding is not None:
+            _semantic_cache.store(scope, embedding, (tokens, response))
+    return response
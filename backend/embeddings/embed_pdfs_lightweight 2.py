@@ -1,11 +1,11 @@
 import os
 import sys
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import pickle
 import gc
 import uuid
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
 # Fix import path for pdf_config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -22,9 +22,14 @@ except ImportError:
         'MAX_CHUNKS': 20,
         'MAX_CHUNKS_PER_PAGE': 3,
         'CHUNK_SIZE': 100,
-        'BATCH_SIZE': 3
+        'BATCH_SIZE': 3,
+        'LOAD_WORKERS': 1
     }
 
+# Page loading (MuPDF with a pypdf fallback, capped at MAX_PAGES) is shared
+# with the in-memory variant of this script
+from embed_pdfs_lightweight import load_pdf_pages
+
 # Setup basic logging for the script
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -38,6 +43,16 @@ MAX_CHUNKS = config['MAX_CHUNKS']
 MAX_CHUNKS_PER_PAGE = config['MAX_CHUNKS_PER_PAGE']
 CHUNK_SIZE = config['CHUNK_SIZE']
 BATCH_SIZE = config['BATCH_SIZE']
+LOAD_WORKERS = config.get('LOAD_WORKERS', 1)
+
+# Use very small chunks; built once and shared by every file (and, with
+# LOAD_WORKERS > 1, created once per worker process at import)
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=20,  # Restored to original for better context
+    length_function=len,
+    separators=["\n\n", "\n", ". ", " ", ""]
+)
 
 def get_file_size_mb(filepath):
     """Get file size in MB"""
@@ -46,6 +61,62 @@ def get_file_size_mb(filepath):
     except:
         return 0
 
+def load_and_split(filename):
+    """Load one document and split it into chunks, honouring the page and chunk limits"""
+    filepath = os.path.join(pdf_folder, filename)
+    file_size = get_file_size_mb(filepath)
+    
+    # Skip large files
+    if file_size > MAX_PDF_SIZE_MB:
+        logging.warning(f"Skipping {filename} - too large ({file_size:.1f}MB > {MAX_PDF_SIZE_MB}MB)")
+        return []
+        
+    logging.info(f"Processing {filename} ({file_size:.1f}MB)...")
+    
+    # Load document with page limit
+    try:
+        if filename.endswith('.pdf'):
+            pages = load_pdf_pages(filepath)
+        elif filename.endswith('.txt'):
+            # Handle text files
+            with open(filepath, 'r', encoding='utf-8') as f:
+                content = f.read()
+            from langchain.schema import Document
+            pages = [Document(page_content=content, metadata={"source": filename})]
+        else:
+            # Skip unsupported file types for now
+            logging.warning(f"Skipping {filename} - unsupported file type")
+            return []
+    except Exception as e:
+        logging.error(f"Error loading {filename}: {e}")
+        return []
+    
+    # Limit pages
+    if len(pages) > MAX_PAGES:
+        logging.info(f"Limiting {filename} to first {MAX_PAGES} pages (total: {len(pages)})")
+        pages = pages[:MAX_PAGES]
+    
+    # Process pages with strict limits
+    chunks = []
+    for i, page in enumerate(pages):
+        try:
+            split_docs = text_splitter.split_documents([page])
+            
+            # Limit chunks per page
+            for doc in split_docs[:MAX_CHUNKS_PER_PAGE]:
+                doc.metadata["source"] = filename
+                doc.metadata["page"] = i + 1
+                chunks.append(doc)
+            
+        except Exception as e:
+            logging.error(f"Error processing page {i+1} of {filename}: {e}")
+            continue
+            
+        if len(chunks) >= MAX_CHUNKS:
+            break
+    
+    return chunks[:MAX_CHUNKS]
+
 def process_and_store_pdfs_lightweight():
     """Lightweight PDF processing with strict limits"""
     # Check if uploads directory exists
@@ -70,102 +141,49 @@ def process_and_store_pdfs_lightweight():
     documents = []
     total_chunks = 0
     
-    # Process one document at a time with strict limits
-    for filename in tqdm(pdf_files, desc="Processing documents"):
-        try:
-            filepath = os.path.join(pdf_folder, filename)
-            file_size = get_file_size_mb(filepath)
-            
-            # Skip large files
-            if file_size > MAX_PDF_SIZE_MB:
-                logging.warning(f"Skipping {filename} - too large ({file_size:.1f}MB > {MAX_PDF_SIZE_MB}MB)")
-                continue
-                
-            logging.info(f"Processing {filename} ({file_size:.1f}MB)...")
+    # Loading and splitting is CPU-bound and independent per file, so with
+    # LOAD_WORKERS > 1 it runs in worker processes ahead of the chunk writer
+    executor = None
+    if LOAD_WORKERS > 1 and len(pdf_files) > 1:
+        executor = ProcessPoolExecutor(max_workers=LOAD_WORKERS)
+        pending = [executor.submit(load_and_split, filename) for filename in pdf_files]
+    
+    try:
+        for position, filename in enumerate(tqdm(pdf_files, desc="Processing documents")):
+            if total_chunks >= MAX_CHUNKS:
+                logging.warning(f"Reached maximum chunks limit ({MAX_CHUNKS})")
+                break
             
-            # Load document with page limit
             try:
-                if filename.endswith('.pdf'):
-                    loader = PyPDFLoader(filepath)
-                    pages = loader.load()
-                elif filename.endswith('.txt'):
-                    # Handle text files
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    from langchain.schema import Document
-                    pages = [Document(page_content=content, metadata={"source": filename})]
-                else:
-                    # Skip unsupported file types for now
-                    logging.warning(f"Skipping {filename} - unsupported file type")
-                    continue
-            except Exception as e:
-                logging.error(f"Error loading {filename}: {e}")
-                continue
-            
-            # Limit pages
-            if len(pages) > MAX_PAGES:
-                logging.info(f"Limiting {filename} to first {MAX_PAGES} pages (total: {len(pages)})")
-                pages = pages[:MAX_PAGES]
-            
-            # Process pages with strict limits
-            for i, page in enumerate(pages):
-                if total_chunks >= MAX_CHUNKS:
-                    logging.warning(f"Reached maximum chunks limit ({MAX_CHUNKS})")
-                    break
-                    
-                try:
-                    # Use very small chunks
-                    text_splitter = RecursiveCharacterTextSplitter(
-                        chunk_size=CHUNK_SIZE,
-                        chunk_overlap=20,  # Restored to original for better context
-                        length_function=len,
-                        separators=["\n\n", "\n", ". ", " ", ""]
-                    )
+                file_docs = pending[position].result() if executor is not None else load_and_split(filename)
+                
+                for doc in file_docs[:MAX_CHUNKS - total_chunks]:
+                    chunk_id = f"chunk_{uuid.uuid4().hex}.txt"
+                    chunk_file_path = os.path.join(chunks_path, chunk_id)
                     
-                    split_docs = text_splitter.split_documents([page])
+                    # Save chunk content to its own file
+                    with open(chunk_file_path, "w", encoding="utf-8") as f:
+                        f.write(doc.page_content)
                     
-                    # Limit chunks per page
-                    if len(split_docs) > MAX_CHUNKS_PER_PAGE:
-                        split_docs = split_docs[:MAX_CHUNKS_PER_PAGE]
+                    # Store path in metadata, clear content from memory
+                    doc.metadata["chunk_path"] = chunk_file_path
+                    doc.page_content = "" # Erase content to save RAM
                     
-                    for doc in split_docs:
-                        chunk_id = f"chunk_{uuid.uuid4().hex}.txt"
-                        chunk_file_path = os.path.join(chunks_path, chunk_id)
-                        
-                        # Save chunk content to its own file
-                        with open(chunk_file_path, "w", encoding="utf-8") as f:
-                            f.write(doc.page_content)
-                        
-                        # Store path in metadata, clear content from memory
-                        doc.metadata["source"] = filename
-                        doc.metadata["page"] = i + 1
-                        doc.metadata["chunk_path"] = chunk_file_path
-                        doc.page_content = "" # Erase content to save RAM
-                        
-                        documents.append(doc)
-                        total_chunks += 1
+                    documents.append(doc)
+                    total_chunks += 1
+                
+                # Clear chunk memory after each file
+                del file_docs
                         
-                        if total_chunks >= MAX_CHUNKS:
-                            break
-                    
-                    # Clear memory after each page
-                    del split_docs
-                    gc.collect()
-                    
-                except Exception as e:
-                    logging.error(f"Error processing page {i+1} of {filename}: {e}")
-                    continue
-                    
-                if total_chunks >= MAX_CHUNKS:
-                    break
-            
-            # Clear page memory after each file
-            del pages
-            gc.collect()
-                    
-        except Exception as e:
-            logging.error(f"Error processing {filename}: {e}")
-            continue
+            except Exception as e:
+                logging.error(f"Error processing {filename}: {e}")
+                continue
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    # One sweep between chunking and embedding, once every page is released
+    gc.collect()
 
     if documents:
         logging.info(f"Successfully processed {len(documents)} chunks")
@@ -192,30 +210,25 @@ def process_and_store_pdfs_lightweight():
                     logging.error(f"Could not read chunk {doc.metadata['chunk_path']}: {e}")
                     texts_for_embedding.append("") # Append empty string on error
 
-            all_embeddings = []
+            import numpy as np
+            import faiss
+            
+            # Write each batch straight into one preallocated float32 array
+            dimension = model.get_sentence_embedding_dimension()
+            embeddings_array = np.empty((len(texts_for_embedding), dimension), dtype=np.float32)
             for i in range(0, len(texts_for_embedding), BATCH_SIZE):
                 batch_texts = texts_for_embedding[i:i + BATCH_SIZE]
                 
                 # Get embeddings
-                embeddings = model.encode(batch_texts, convert_to_tensor=False)
-                all_embeddings.extend(embeddings.tolist())
-                
-                # Clear memory
-                del batch_texts, embeddings
-                gc.collect()
+                embeddings_array[i:i + BATCH_SIZE] = model.encode(
+                    batch_texts, convert_to_numpy=True, normalize_embeddings=True
+                )
             
             # Clear the large list of texts
             del texts_for_embedding
             gc.collect()
 
             # Create simple FAISS index
-            import numpy as np
-            import faiss
-            
-            embeddings_array = np.array(all_embeddings).astype('float32')
-            
-            # Create index
-            dimension = embeddings_array.shape[1]
             index = faiss.IndexFlatIP(dimension)
             index.add(embeddings_array)
             
@@ -232,7 +245,7 @@ def process_and_store_pdfs_lightweight():
             logging.info(f"Index contains {len(documents)} chunks with {dimension}-dimensional embeddings")
             
             # Clear large objects
-            del embeddings_array, all_embeddings, index
+            del embeddings_array, index
             gc.collect()
             
         except Exception as e:
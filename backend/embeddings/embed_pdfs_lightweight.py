@@ -6,6 +6,7 @@ import pickle
 import gc
 import uuid
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
 # Fix import path for pdf_config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -22,7 +23,8 @@ except ImportError:
         'MAX_CHUNKS': 20,
         'MAX_CHUNKS_PER_PAGE': 3,
         'CHUNK_SIZE': 100,
-        'BATCH_SIZE': 3
+        'BATCH_SIZE': 3,
+        'LOAD_WORKERS': 1
     }
 
 # Setup basic logging for the script
@@ -37,6 +39,18 @@ MAX_CHUNKS = config['MAX_CHUNKS']
 MAX_CHUNKS_PER_PAGE = config['MAX_CHUNKS_PER_PAGE']
 CHUNK_SIZE = config['CHUNK_SIZE']
 BATCH_SIZE = config['BATCH_SIZE']
+LOAD_WORKERS = config.get('LOAD_WORKERS', 1)
+# Embeddings buffered to learn the quantizer ranges before anything is indexed
+INDEX_TRAIN_SAMPLE = 256
+
+# Use very small chunks; built once and shared by every file (and, with
+# LOAD_WORKERS > 1, created once per worker process at import)
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=20,  # Restored to original for better context
+    length_function=len,
+    separators=["\n\n", "\n", ". ", " ", ""]
+)
 
 def get_file_size_mb(filepath):
     """Get file size in MB"""
@@ -45,6 +59,110 @@ def get_file_size_mb(filepath):
     except:
         return 0
 
+def load_embedding_model():
+    """Load the lightest available sentence-transformers model"""
+    from sentence_transformers import SentenceTransformer
+    
+    try:
+        return SentenceTransformer('paraphrase-MiniLM-L3-v2')
+    except:
+        # Fallback to even lighter model
+        return SentenceTransformer('all-MiniLM-L6-v2')
+
+def new_index(training_vectors):
+    """Create an empty inner-product index storing 8-bit scalar-quantized vectors"""
+    import faiss
+    
+    # QT_8bit learns a separate range per dimension from real embeddings, so the
+    # 256 levels cover the values each dimension actually takes instead of the
+    # whole [-1, 1] interval. Codes take 1 byte per dimension instead of 4.
+    index = faiss.IndexScalarQuantizer(
+        training_vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    index.train(training_vectors)
+    return index
+
+def build_index(vector_batches):
+    """Train a new index on the buffered embeddings, then add them to it"""
+    import numpy as np
+    
+    vectors = np.vstack(vector_batches)
+    vector_batches.clear()
+    index = new_index(vectors)
+    index.add(vectors)
+    return index
+
+def load_pdf_pages(filepath):
+    """Load up to MAX_PAGES pages of a PDF with MuPDF, falling back to pypdf"""
+    try:
+        import pymupdf
+    except ImportError:
+        return PyPDFLoader(filepath).load()
+    
+    from langchain.schema import Document
+    # Same page Documents as PyPDFLoader, but pages past the limit are never parsed
+    with pymupdf.open(filepath) as pdf:
+        return [
+            Document(page_content=pdf[i].get_text("text"), metadata={"source": filepath, "page": i})
+            for i in range(min(pdf.page_count, MAX_PAGES))
+        ]
+
+def load_and_split(filename):
+    """Load one document and split it into chunks, honouring the page and chunk limits"""
+    filepath = os.path.join(pdf_folder, filename)
+    file_size = get_file_size_mb(filepath)
+    
+    # Skip large files
+    if file_size > MAX_PDF_SIZE_MB:
+        logging.warning(f"Skipping {filename} - too large ({file_size:.1f}MB > {MAX_PDF_SIZE_MB}MB)")
+        return []
+        
+    logging.info(f"Processing {filename} ({file_size:.1f}MB)...")
+    
+    # Load document with page limit
+    try:
+        if filename.endswith('.pdf'):
+            pages = load_pdf_pages(filepath)
+        elif filename.endswith('.txt'):
+            # Handle text files
+            with open(filepath, 'r', encoding='utf-8') as f:
+                content = f.read()
+            from langchain.schema import Document
+            pages = [Document(page_content=content, metadata={"source": filename})]
+        else:
+            # Skip unsupported file types for now
+            logging.warning(f"Skipping {filename} - unsupported file type")
+            return []
+    except Exception as e:
+        logging.error(f"Error loading {filename}: {e}")
+        return []
+    
+    # Limit pages
+    if len(pages) > MAX_PAGES:
+        logging.info(f"Limiting {filename} to first {MAX_PAGES} pages (total: {len(pages)})")
+        pages = pages[:MAX_PAGES]
+    
+    # Process pages with strict limits
+    chunks = []
+    for i, page in enumerate(pages):
+        try:
+            split_docs = text_splitter.split_documents([page])
+            
+            # Limit chunks per page
+            for doc in split_docs[:MAX_CHUNKS_PER_PAGE]:
+                doc.metadata["source"] = filename
+                doc.metadata["page"] = i + 1
+                chunks.append(doc)
+            
+        except Exception as e:
+            logging.error(f"Error processing page {i+1} of {filename}: {e}")
+            continue
+            
+        if len(chunks) >= MAX_CHUNKS:
+            break
+    
+    return chunks[:MAX_CHUNKS]
+
 def process_and_store_pdfs_lightweight():
     """Lightweight PDF processing with strict limits"""
     # Check if uploads directory exists
@@ -64,139 +182,81 @@ def process_and_store_pdfs_lightweight():
 
     documents = []
     total_chunks = 0
+    # Chunks are embedded file by file into one index. Vectors are held back
+    # only until INDEX_TRAIN_SAMPLE of them have been seen to train it on
+    model = None
+    index = None
+    untrained_vectors = []
+    seen_chunks = set()
     
-    # Process one document at a time with strict limits
-    for filename in tqdm(pdf_files, desc="Processing documents"):
-        try:
-            filepath = os.path.join(pdf_folder, filename)
-            file_size = get_file_size_mb(filepath)
-            
-            # Skip large files
-            if file_size > MAX_PDF_SIZE_MB:
-                logging.warning(f"Skipping {filename} - too large ({file_size:.1f}MB > {MAX_PDF_SIZE_MB}MB)")
-                continue
-                
-            logging.info(f"Processing {filename} ({file_size:.1f}MB)...")
+    # Loading and splitting is CPU-bound and independent per file, so with
+    # LOAD_WORKERS > 1 it runs in worker processes ahead of the embedding loop
+    executor = None
+    if LOAD_WORKERS > 1 and len(pdf_files) > 1:
+        executor = ProcessPoolExecutor(max_workers=LOAD_WORKERS)
+        pending = [executor.submit(load_and_split, filename) for filename in pdf_files]
+    
+    try:
+        for position, filename in enumerate(tqdm(pdf_files, desc="Processing documents")):
+            if total_chunks >= MAX_CHUNKS:
+                logging.warning(f"Reached maximum chunks limit ({MAX_CHUNKS})")
+                break
             
-            # Load document with page limit
             try:
-                if filename.endswith('.pdf'):
-                    loader = PyPDFLoader(filepath)
-                    pages = loader.load()
-                elif filename.endswith('.txt'):
-                    # Handle text files
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    from langchain.schema import Document
-                    pages = [Document(page_content=content, metadata={"source": filename})]
-                else:
-                    # Skip unsupported file types for now
-                    logging.warning(f"Skipping {filename} - unsupported file type")
-                    continue
+                file_docs = pending[position].result() if executor is not None else load_and_split(filename)
+                file_docs = file_docs[:MAX_CHUNKS - total_chunks]
+                total_chunks += len(file_docs)
+                
+                # Identical chunks (repeated headers, boilerplate pages) would only add duplicate rows
+                unique_docs = []
+                for doc in file_docs:
+                    if doc.page_content not in seen_chunks:
+                        seen_chunks.add(doc.page_content)
+                        unique_docs.append(doc)
+                
+                if unique_docs:
+                    if model is None:
+                        model = load_embedding_model()
+                    # The model runs BATCH_SIZE texts per forward pass; unit vectors
+                    # make the inner-product index a cosine index
+                    vectors = model.encode(
+                        [doc.page_content for doc in unique_docs],
+                        batch_size=BATCH_SIZE,
+                        normalize_embeddings=True,
+                        convert_to_numpy=True
+                    ).astype('float32', copy=False)
+                    if index is None:
+                        untrained_vectors.append(vectors)
+                        if sum(len(v) for v in untrained_vectors) >= INDEX_TRAIN_SAMPLE:
+                            index = build_index(untrained_vectors)
+                    else:
+                        index.add(vectors)
+                    # Only keep documents whose vectors made it into the index
+                    documents.extend(unique_docs)
+                    del vectors
+                
+                # Clear memory after each file
+                del file_docs, unique_docs
+                gc.collect()
+                        
             except Exception as e:
-                logging.error(f"Error loading {filename}: {e}")
+                logging.error(f"Error processing {filename}: {e}")
                 continue
-            
-            # Limit pages
-            if len(pages) > MAX_PAGES:
-                logging.info(f"Limiting {filename} to first {MAX_PAGES} pages (total: {len(pages)})")
-                pages = pages[:MAX_PAGES]
-            
-            # Process pages with strict limits
-            for i, page in enumerate(pages):
-                if total_chunks >= MAX_CHUNKS:
-                    logging.warning(f"Reached maximum chunks limit ({MAX_CHUNKS})")
-                    break
-                    
-                try:
-                    # Use very small chunks
-                    text_splitter = RecursiveCharacterTextSplitter(
-                        chunk_size=CHUNK_SIZE,
-                        chunk_overlap=20,  # Restored to original for better context
-                        length_function=len,
-                        separators=["\n\n", "\n", ". ", " ", ""]
-                    )
-                    
-                    split_docs = text_splitter.split_documents([page])
-                    
-                    # Limit chunks per page
-                    if len(split_docs) > MAX_CHUNKS_PER_PAGE:
-                        split_docs = split_docs[:MAX_CHUNKS_PER_PAGE]
-                    
-                    for doc in split_docs:
-                        doc.metadata["source"] = filename
-                        doc.metadata["page"] = i + 1
-                        documents.append(doc)
-                        total_chunks += 1
-                        
-                        if total_chunks >= MAX_CHUNKS:
-                            break
-                    
-                    # Clear memory after each page
-                    del split_docs
-                    gc.collect()
-                    
-                except Exception as e:
-                    logging.error(f"Error processing page {i+1} of {filename}: {e}")
-                    continue
-                    
-                if total_chunks >= MAX_CHUNKS:
-                    break
-            
-            # Clear page memory after each file
-            del pages
-            gc.collect()
-                    
-        except Exception as e:
-            logging.error(f"Error processing {filename}: {e}")
-            continue
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    
+    # Fewer vectors than the sample: train on everything that was embedded
+    if index is None and untrained_vectors:
+        index = build_index(untrained_vectors)
 
     if documents:
         logging.info(f"Successfully processed {len(documents)} chunks")
         
-        # Create minimal index
+        # Save index and documents
         try:
-            # Use a very simple embedding approach
-            from sentence_transformers import SentenceTransformer
-            
-            # Load the lightest possible model
-            try:
-                model = SentenceTransformer('paraphrase-MiniLM-L3-v2')
-            except:
-                # Fallback to even lighter model
-                model = SentenceTransformer('all-MiniLM-L6-v2')
-            
-            # Create embeddings in very small batches
-            texts_for_embedding = [doc.page_content for doc in documents]
-            
-            all_embeddings = []
-            for i in range(0, len(texts_for_embedding), BATCH_SIZE):
-                batch_texts = texts_for_embedding[i:i + BATCH_SIZE]
-                
-                # Get embeddings
-                embeddings = model.encode(batch_texts, convert_to_tensor=False)
-                all_embeddings.extend(embeddings.tolist())
-                
-                # Clear memory
-                del batch_texts, embeddings
-                gc.collect()
-            
-            # Clear the large list of texts
-            del texts_for_embedding
-            gc.collect()
-
-            # Create simple FAISS index
-            import numpy as np
             import faiss
             
-            embeddings_array = np.array(all_embeddings).astype('float32')
-            
-            # Create index
-            dimension = embeddings_array.shape[1]
-            index = faiss.IndexFlatIP(dimension)
-            index.add(embeddings_array)
-            
-            # Save index and documents
             if not os.path.exists(index_path):
                 os.makedirs(index_path)
                 
@@ -206,11 +266,7 @@ def process_and_store_pdfs_lightweight():
                 pickle.dump(documents, f)
                 
             logging.info(f"Lightweight FAISS index saved to {index_path}")
-            logging.info(f"Index contains {len(documents)} chunks with {dimension}-dimensional embeddings")
-            
-            # Clear large objects
-            del embeddings_array, all_embeddings, index
-            gc.collect()
+            logging.info(f"Index contains {len(documents)} chunks with {index.d}-dimensional embeddings")
             
         except Exception as e:
             logging.error(f"Error creating index: {e}")
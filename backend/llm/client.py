@@ -1,44 +1,71 @@
 import requests
+import httpx
 import os
 import json
+from typing import AsyncGenerator, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env (supports both backend/.env and root .env)
 load_dotenv()
 
 GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:streamGenerateContent"
 
 gemini_api_key = os.environ.get('GEMINI_API_KEY')
 if not gemini_api_key:
     raise RuntimeError("Gemini API key not set. Please set the GEMINI_API_KEY environment variable.")
 
-def query(context: str, prompt: str) -> str:
-    # Load system prompt from environment, fallback to default
-    system_instruction = os.environ.get(
-        "SYSTEM_PROMPT",
-        "You are a helpful, friendly, and professional legal assistant. "
-        "You may respond to greetings, small talk, and polite conversation in a natural, human-like way but only very short answers only. Greeting and small talks must not be more than 1 line. Do not give any information unless asked by the user explicitely, answer or talk only as much as required. "
-        "For legal or document-related questions, answer only if the information is present in the provided context/database. "
-        "If you do not know the answer or it is not present in the context, say 'I don't know' or politely indicate you cannot answer. "
-        "Do not make up information or hallucinate. Stay within the scope of the provided legal documents and data. "
-        "If a user asks something completely out of scope (not a greeting, small talk, or legal/document question), politely decline to answer."
-
-    )
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a helpful, friendly, and professional legal assistant. "
+    "You may respond to greetings, small talk, and polite conversation in a natural, human-like way but only very short answers only. Greeting and small talks must not be more than 1 line. Do not give any information unless asked by the user explicitely, answer or talk only as much as required. "
+    "For legal or document-related questions, answer only if the information is present in the provided context/database. "
+    "If you do not know the answer or it is not present in the context, say 'I don't know' or politely indicate you cannot answer. "
+    "Do not make up information or hallucinate. Stay within the scope of the provided legal documents and data. "
+    "If a user asks something completely out of scope (not a greeting, small talk, or legal/document question), politely decline to answer."
+)
+
+NO_DOCUMENTS_RESPONSE = "I don't see any documents uploaded to analyze. Please upload a PDF, DOCX, or TXT file first, and then I'll be happy to help you analyze its contents, extract key information, or answer questions about it."
+INVALID_RESPONSE = "Sorry, the language model did not return a valid response. Please try again later."
+TIMEOUT_RESPONSE = "Request timed out. Please try again."
+
+# Shared async HTTP client - keeps TLS connections to Gemini alive across requests
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the pooled async HTTP client, creating it on first use"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=30.0
+        )
+    return _http_client
+
+async def close_http_client() -> None:
+    """Close the pooled async HTTP client"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def _build_request(context: str, prompt: str, system: Optional[str] = None) -> dict:
+    # Caller's system prompt, else from environment, fallback to default. It leads
+    # the request so identical instructions share a prefix across calls.
+    system_instruction = system or os.environ.get("SYSTEM_PROMPT", DEFAULT_SYSTEM_PROMPT)
     # Gemini expects a single prompt string, but we can concatenate context and prompt
     if len(context) > 2500:
         context = context[:2500] + "..."
     if len(prompt) > 800:
         prompt = prompt[:800] + "..."
     
-    # Handle special case where no documents are uploaded
-    if context.startswith("NO_DOCUMENTS_UPLOADED:"):
-        return "I don't see any documents uploaded to analyze. Please upload a PDF, DOCX, or TXT file first, and then I'll be happy to help you analyze its contents, extract key information, or answer questions about it."
-    
     # Combine system instruction, context, and prompt
     full_prompt = system_instruction + "Context:\n" + context + "\n\nQuestion: " + prompt
-    
+    return _build_payload(full_prompt)
+
+def _build_payload(full_prompt: str) -> dict:
     # Gemini expects a 'contents' list with 'role' and 'parts'
-    data = {
+    return {
         "contents": [
             {"role": "user", "parts": [{"text": full_prompt}]}
         ],
@@ -47,23 +74,72 @@ def query(context: str, prompt: str) -> str:
             "temperature": 0.7
         }
     }
+
+def _extract_text(resp_json: dict) -> Optional[str]:
+    # Gemini returns candidates[0].content.parts[0].text
+    if "candidates" in resp_json and resp_json["candidates"]:
+        parts = resp_json["candidates"][0].get("content", {}).get("parts", [])
+        if parts and "text" in parts[0]:
+            return parts[0]["text"]
+    return None
+
+def _parse_response(resp_json: dict) -> str:
+    result = _extract_text(resp_json)
+    if result is None:
+        return INVALID_RESPONSE
+    if len(result) > 800:
+        result = result[:800] + "..."
+    return result
+
+def query(context: str, prompt: str, system: Optional[str] = None) -> str:
+    # Handle special case where no documents are uploaded
+    if context.startswith("NO_DOCUMENTS_UPLOADED:"):
+        return NO_DOCUMENTS_RESPONSE
+    
+    data = _build_request(context, prompt, system)
     params = {"key": gemini_api_key}
     try:
         response = requests.post(GEMINI_API_URL, params=params, json=data, timeout=30)
         response.raise_for_status()
-        resp_json = response.json()
-        # Gemini returns candidates[0].content.parts[0].text
-        if "candidates" in resp_json and resp_json["candidates"]:
-            parts = resp_json["candidates"][0].get("content", {}).get("parts", [])
-            if parts and "text" in parts[0]:
-                result = parts[0]["text"]
-                if len(result) > 800:
-                    result = result[:800] + "..."
-                return result
-        return "Sorry, the language model did not return a valid response. Please try again later."
+        return _parse_response(response.json())
     except requests.exceptions.Timeout:
-        return "Request timed out. Please try again."
+        return TIMEOUT_RESPONSE
     except Exception as e:
         return f"Error: {str(e)[:100]}"
+
+async def agenerate(context: str, prompt: str, system: Optional[str] = None) -> str:
+    """Generate a complete reply through the pooled HTTP client, raising on failure"""
+    data = _build_request(context, prompt, system)
+    params = {"key": gemini_api_key}
+    response = await get_http_client().post(GEMINI_API_URL, params=params, json=data)
+    response.raise_for_status()
+    return _parse_response(response.json())
+
+async def aquery(context: str, prompt: str, system: Optional[str] = None) -> str:
+    """Async variant of query() that reuses the pooled HTTP client"""
+    # Handle special case where no documents are uploaded
+    if context.startswith("NO_DOCUMENTS_UPLOADED:"):
+        return NO_DOCUMENTS_RESPONSE
+    
+    try:
+        return await agenerate(context, prompt, system)
+    except httpx.TimeoutException:
+        return TIMEOUT_RESPONSE
+    except Exception as e:
+        return f"Error: {str(e)[:100]}"
+
+async def astream(context: str, prompt: str, system: Optional[str] = None) -> AsyncGenerator[str, None]:
+    """Stream text chunks as Gemini generates them, from the same request as agenerate()"""
+    data = _build_request(context, prompt, system)
+    params = {"key": gemini_api_key, "alt": "sse"}
+    async with get_http_client().stream("POST", GEMINI_STREAM_URL, params=params, json=data) as response:
+        response.raise_for_status()
+        # Server-sent events: each "data:" line carries a partial GenerateContentResponse
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            text = _extract_text(json.loads(line[5:]))
+            if text:
+                yield text
 # update Sun Jul  6 02:54:59 IST 2025
 # update Sun Jul  6 02:56:34 IST 2025
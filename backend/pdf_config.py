@@ -8,7 +8,9 @@ RENDER_FREE_TIER = {
     'MAX_CHUNKS': 20,          # Increased from 10 for better coverage
     'MAX_CHUNKS_PER_PAGE': 3,  # Increased from 2 for better text processing
     'CHUNK_SIZE': 100,         # Increased from 60 for better context
-    'BATCH_SIZE': 3            # Increased from 2 for better performance
+    'BATCH_SIZE': 3,           # Increased from 2 for better performance
+    'LOAD_WORKERS': 1,         # Each loader process imports langchain; no room at 512MB
+    'PDF_EXTRACT_WORKERS': 0   # API extracts uploads in-process; worker pools don't fit in 512MB
 }
 
 # Render Paid Tier Settings (More generous)
@@ -18,7 +20,9 @@ RENDER_PAID_TIER = {
     'MAX_CHUNKS': 80,          # Increased from 50
     'MAX_CHUNKS_PER_PAGE': 6,  # Increased from 4
     'CHUNK_SIZE': 150,         # Increased from 100
-    'BATCH_SIZE': 6            # Increased from 4
+    'BATCH_SIZE': 6,           # Increased from 4
+    'LOAD_WORKERS': 2,         # Processes loading and splitting files in parallel
+    'PDF_EXTRACT_WORKERS': 2   # API worker processes for uploads of 32+ pages (capped at 2)
 }
 
 def get_config(tier='free'):